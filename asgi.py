@@ -0,0 +1,8 @@
+from sqlalchemy.ext.asyncio import create_async_engine
+from library import app
+from services.asgi import AsgiApp
+from services.pool import async_url, engine_options
+
+# uvicorn asgi:application
+application = AsgiApp(app, create_async_engine(async_url(app.config['SQLALCHEMY_DATABASE_URI']),
+                                               **engine_options(app.config, asynchronous=True)))
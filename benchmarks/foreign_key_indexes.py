@@ -0,0 +1,113 @@
+""" Query plans with and without the foreign key indexes, on a seeded dataset.
+
+    python -m benchmarks.foreign_key_indexes [books]
+
+The tables are created in a scratch schema inside one transaction that is
+rolled back at the end, so the configured database is left as it was.
+"""
+import sys
+from sqlalchemy import text
+from library import db
+
+SEED = (
+    "INSERT INTO genre (id, name) SELECT g, 'genre ' || g FROM generate_series(1, 50) g",
+    "INSERT INTO author (id, firstname, lastname, biography) "
+    "SELECT g, 'firstname ' || g, 'lastname ' || g, 'biography ' || g FROM generate_series(1, :books / 4) g",
+    "INSERT INTO book (id, name, isbn, publisher, format, pages, genre_id) "
+    "SELECT g, 'name ' || g, 'isbn ' || g, 'publisher ' || g, 'paper', 100 + g % 900, 1 + g % 50 "
+    "FROM generate_series(1, :books) g",
+    "INSERT INTO author_book (author_id, book_id) "
+    "SELECT DISTINCT 1 + (g * k) % (:books / 4), g FROM generate_series(1, :books) g, generate_series(1, 2) k",
+    'INSERT INTO "user" (id, username, firstname, lastname, "_User__password") '
+    "SELECT g, 'username ' || g, 'firstname ' || g, 'lastname ' || g, '' FROM generate_series(1, :books / 2) g",
+    'INSERT INTO "order" (id, user_id) SELECT g, 1 + g % (:books / 2) FROM generate_series(1, :books * 2) g',
+    "INSERT INTO order_item (id, order_id, book_id) "
+    "SELECT g, 1 + g % (:books * 2), 1 + (g * 31) % :books FROM generate_series(1, :books * 5) g",
+    "INSERT INTO review (id, user_id, book_id, message) "
+    "SELECT g, 1 + g % (:books / 2), 1 + (g * 17) % :books, 'message ' || g FROM generate_series(1, :books * 3) g",
+    "INSERT INTO review_image (id, review_id) SELECT g, 1 + g % (:books * 3) FROM generate_series(1, :books * 3) g",
+)
+
+# every row looked up or deleted below exists at any scale
+ROW = 42
+
+
+def foreign_key_indexes():
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if all(column.foreign_keys for column in index.columns):
+                yield index
+
+
+def queries():
+    """ ``(label, sql)``: the relationship loads and the cascading deletes the indexes serve. """
+    parents = set()
+
+    for index in foreign_key_indexes():
+        column, = index.columns
+        parents.add(next(iter(column.foreign_keys)).column.table.name)
+
+        yield f'{index.table.name}.{column.name} = {ROW}', f'SELECT * FROM "{index.table.name}" WHERE {column.name} = {ROW}'
+
+    for parent in sorted(parents):
+        yield f'DELETE {parent} {ROW}', f'DELETE FROM "{parent}" WHERE id = {ROW}'
+
+
+def explain(connection, sql):
+    """ The root plan node and the execution time of ``sql``. """
+    # the deletes must not change the data the next plan runs on
+    savepoint = connection.begin_nested()
+    result, = connection.execute(text(f'EXPLAIN (ANALYZE, FORMAT JSON) {sql}')).scalar()
+    savepoint.rollback()
+
+    node = result['Plan']['Node Type']
+    triggers = result.get('Triggers')
+
+    if triggers:
+        node = f'{node} + {len(triggers)} triggers'
+
+    # the execution time includes the triggers doing the cascade
+    return f"{node} {result['Execution Time']:.2f} ms"
+
+
+def plans(connection):
+    for table in db.metadata.sorted_tables:
+        connection.execute(text(f'ANALYZE "{table.name}"'))
+
+    return {label: explain(connection, sql) for label, sql in queries()}
+
+
+def main(books=20000):
+    with db.engine.connect() as connection:
+        transaction = connection.begin()
+
+        try:
+            connection.execute(text('CREATE SCHEMA benchmark'))
+            connection.execute(text('SET LOCAL search_path TO benchmark'))
+            db.metadata.create_all(connection)
+
+            for index in foreign_key_indexes():
+                index.drop(connection)
+
+            for statement in SEED:
+                connection.execute(text(statement), {'books': books})
+
+            before = plans(connection)
+
+            for index in foreign_key_indexes():
+                index.create(connection)
+
+            after = plans(connection)
+        finally:
+            transaction.rollback()
+
+    width = max(map(len, before)) + 2
+    plan_width = max(map(len, before.values())) + 2
+    print(f'{"query":<{width}}{"before":<{plan_width}}after')
+
+    for label in before:
+        print(f'{label:<{width}}{before[label]:<{plan_width}}{after[label]}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,80 @@
+""" Concurrent checkouts against a few hot books: throughput, oversell and deadlocks.
+
+    python -m benchmarks.inventory_contention [threads] [checkouts] [books]
+
+Seeds a genre and its books with ids far above the application's and
+deletes them at the end.
+"""
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import OperationalError
+from library import app, db
+from library.models import Book, Genre
+from services.inventory import reserve, OutOfStock
+
+FIRST_ID = 900000
+STOCK = 5000
+
+
+def checkout(cart):
+    with app.app_context():
+        try:
+            reserve(cart)
+            db.session.commit()
+
+            return 'reserved'
+        except OutOfStock:
+            db.session.rollback()
+
+            return 'out of stock'
+        except OperationalError as e:
+            db.session.rollback()
+
+            return 'deadlock' if 'deadlock' in str(e) else 'error'
+
+
+def main(threads=16, checkouts=5000, books=5):
+    ids = list(range(FIRST_ID, FIRST_ID + books))
+    random.seed(0)
+    carts = [{id: random.randint(1, 3) for id in random.sample(ids, random.randint(1, books))}
+             for _ in range(checkouts)]
+
+    db.session.add(Genre(id=FIRST_ID, name='benchmark'))
+    db.session.flush()
+    db.session.add_all([Book(id=id, name=f'benchmark {id}', isbn='benchmark', publisher='benchmark',
+                             count=STOCK, genre_id=FIRST_ID) for id in ids])
+    db.session.commit()
+
+    try:
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(checkout, carts))
+
+        elapsed = time.perf_counter() - started
+        db.session.expire_all()
+        counts = {book.id: book.count for book in Book.query.filter(Book.id.in_(ids))}
+    finally:
+        db.session.delete(Genre.query.get(FIRST_ID))
+        db.session.commit()
+
+    taken = {id: 0 for id in ids}
+
+    for cart, result in zip(carts, results):
+        if result == 'reserved':
+            for id, amount in cart.items():
+                taken[id] += amount
+
+    print(f'{checkouts} checkouts on {threads} threads in {elapsed:.2f} s ({checkouts / elapsed:.0f}/s)')
+
+    for result in ('reserved', 'out of stock', 'deadlock', 'error'):
+        print(f'{result:<14}{results.count(result)}')
+
+    oversold = [id for id in ids if counts[id] < 0 or counts[id] != STOCK - taken[id]]
+    print(f'oversold      {len(oversold)}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -2,9 +2,9 @@ import os
 import datetime
 from os.path import join, dirname
 from dotenv import load_dotenv
-from flask import Flask, got_request_exception
+from flask import Flask, got_request_exception, jsonify, request
 from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
+from library.sessions import RoutingSQLAlchemy
 from flask_migrate import Migrate
 from flask_bcrypt import Bcrypt
 from flask_restful import Api
@@ -29,6 +29,22 @@ app.config.update(
     SQLALCHEMY_DATABASE_URI=f'postgresql://{database_user}:{database_password}@{database_host}/{database_db}',
     SECRET_KEY=os.environ.get('SECRET_KEY'),
     SQLALCHEMY_TRACK_MODIFICATIONS=False,
+    DATABASE_POOL_SIZE=int(os.environ.get('DATABASE_POOL_SIZE', 5)),
+    DATABASE_MAX_OVERFLOW=int(os.environ.get('DATABASE_MAX_OVERFLOW', 10)),
+    DATABASE_POOL_TIMEOUT=float(os.environ.get('DATABASE_POOL_TIMEOUT', 30)),
+    # seconds, below the server's (or pgbouncer's) idle connection timeout
+    DATABASE_POOL_RECYCLE=int(os.environ.get('DATABASE_POOL_RECYCLE', 1800)),
+    DATABASE_POOL_PRE_PING=os.environ.get('DATABASE_POOL_PRE_PING', 'true').lower() == 'true',
+    # milliseconds, 0 for none
+    DATABASE_STATEMENT_TIMEOUT=int(os.environ.get('DATABASE_STATEMENT_TIMEOUT', 0)),
+    # behind pgbouncer in transaction mode: no session state outlives a transaction
+    DATABASE_TRANSACTION_POOLER=os.environ.get('DATABASE_TRANSACTION_POOLER', 'false').lower() == 'true',
+    # comma separated, read-only requests are spread over them
+    DATABASE_REPLICA_URLS=[url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url],
+    DATABASE_REPLICA_MAX_LAG=float(os.environ.get('DATABASE_REPLICA_MAX_LAG', 10)),
+    DATABASE_REPLICA_CHECK_INTERVAL=float(os.environ.get('DATABASE_REPLICA_CHECK_INTERVAL', 5)),
+    # seconds a client reads from the primary after writing
+    DATABASE_REPLICA_LAG_GUARD=int(os.environ.get('DATABASE_REPLICA_LAG_GUARD', 5)),
     ENV=os.environ.get('ENV'),
     DEBUG=os.environ.get('DEBUG'),
     JWT_EXPIRATION_DELTA=datetime.timedelta(days=30),
@@ -36,17 +52,70 @@ app.config.update(
     ALLOWED_EXTENSIONS={'png', 'jpg', 'jpeg', 'gif', 'svg', 'bmp'},
     ALLOWED_MIMETYPES_EXTENSIONS={'image/apng', 'image/bmp', 'image/jpeg',
                                   'image/png', 'image/svg+xml'},
-    MAX_CONTENT_LENGTH=4 * 1024 * 1024
+    MAX_CONTENT_LENGTH=4 * 1024 * 1024,
+    PAGINATION_DEFAULT_LIMIT=int(os.environ.get('PAGINATION_DEFAULT_LIMIT', 50)),
+    PAGINATION_MAX_LIMIT=int(os.environ.get('PAGINATION_MAX_LIMIT', 500)),
+    STREAM_BATCH_SIZE=int(os.environ.get('STREAM_BATCH_SIZE', 1000)),
+    IDENTITY_CACHE_SIZE=int(os.environ.get('IDENTITY_CACHE_SIZE', 1024)),
+    # seconds; invalidated per process, other workers see a changed or deleted user after at most this
+    IDENTITY_CACHE_TTL=int(os.environ.get('IDENTITY_CACHE_TTL', 5)),
+    HASHING_WORKERS=int(os.environ.get('HASHING_WORKERS', os.cpu_count() or 1)),
+    HASHING_QUEUE_DEPTH=int(os.environ.get('HASHING_QUEUE_DEPTH', 16)),
+    HASHING_TIMEOUT=float(os.environ.get('HASHING_TIMEOUT', 5)),
+    HASHING_RETRY_AFTER=int(os.environ.get('HASHING_RETRY_AFTER', 1)),
+    RESPONSE_CACHE_SIZE=int(os.environ.get('RESPONSE_CACHE_SIZE', 2048)),
+    RESPONSE_CACHE_TTL=int(os.environ.get('RESPONSE_CACHE_TTL', 30)),
+    BULK_MAX_ITEMS=int(os.environ.get('BULK_MAX_ITEMS', 5000)),
+    BACKGROUND_WORKERS=int(os.environ.get('BACKGROUND_WORKERS', 2)),
+    SPARSE_SCHEMA_CACHE_SIZE=int(os.environ.get('SPARSE_SCHEMA_CACHE_SIZE', 128)),
+    # variant name -> longest side in pixels, generated as WebP for every uploaded picture
+    IMAGE_VARIANTS={'thumb': int(os.environ.get('IMAGE_THUMB_SIZE', 128)),
+                    'medium': int(os.environ.get('IMAGE_MEDIUM_SIZE', 512))},
+    # nginx internal location serving UPLOAD_FOLDER, e.g. /protected-upload/; unset serves the files from Flask
+    MEDIA_ACCEL_REDIRECT=os.environ.get('MEDIA_ACCEL_REDIRECT'),
+    MEDIA_MAX_AGE=int(os.environ.get('MEDIA_MAX_AGE', 365 * 24 * 60 * 60)),
+    # local (UPLOAD_FOLDER) or s3, any S3-compatible server
+    STORAGE_BACKEND=os.environ.get('STORAGE_BACKEND', 'local'),
+    S3_BUCKET=os.environ.get('S3_BUCKET'),
+    S3_ENDPOINT_URL=os.environ.get('S3_ENDPOINT_URL'),
+    S3_REGION=os.environ.get('S3_REGION'),
+    S3_ACCESS_KEY_ID=os.environ.get('S3_ACCESS_KEY_ID'),
+    S3_SECRET_ACCESS_KEY=os.environ.get('S3_SECRET_ACCESS_KEY'),
+    S3_PART_SIZE=int(os.environ.get('S3_PART_SIZE', 8 * 1024 * 1024)),
+    S3_UPLOAD_WORKERS=int(os.environ.get('S3_UPLOAD_WORKERS', 4)),
+    S3_URL_EXPIRES=int(os.environ.get('S3_URL_EXPIRES', 3600))
 )
 
 logging.basicConfig(filename='logs.log', level=logging.WARNING)
 
-db = SQLAlchemy(app)
+db = RoutingSQLAlchemy(app)
 migrate = Migrate(app, db)
 api = Api(app, catch_all_404s=True)
 ma = Marshmallow(app)
 bcrypt = Bcrypt(app)
 
+from services.hashing import HashingService, HashingUnavailable
+from services.background import Background
+from services.storage import create_storage
+from services.pool import engine_options, set_statement_timeout
+from services.replicas import ReplicaSet
+
+# read when the engine is first used
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
+hashing = HashingService(app.config['HASHING_WORKERS'],
+                         app.config['HASHING_QUEUE_DEPTH'],
+                         app.config['HASHING_TIMEOUT'],
+                         app.config['HASHING_RETRY_AFTER'],
+                         rounds=app.config.get('BCRYPT_LOG_ROUNDS', 12))
+background = Background(app, app.config['BACKGROUND_WORKERS'])
+storage = create_storage(app.config)
+# only used by the ASGI mode, which refuses transaction poolers
+async_options = None if app.config['DATABASE_TRANSACTION_POOLER'] else engine_options(app.config, asynchronous=True)
+replicas = ReplicaSet(app.config['DATABASE_REPLICA_URLS'], engine_options(app.config), async_options, background,
+                      app.config['DATABASE_REPLICA_MAX_LAG'], app.config['DATABASE_REPLICA_CHECK_INTERVAL'],
+                      app.config['DATABASE_REPLICA_LAG_GUARD'], app.logger)
+
 
 def log_exception(sender, exception, **extra):
     """ Log an exception to our logging framework """
@@ -56,7 +125,41 @@ def log_exception(sender, exception, **extra):
 got_request_exception.connect(log_exception, app)
 
 
+@app.before_request
+def route_reads():
+    # the asyncpg engine when served by services.asgi
+    primary = request.environ.get('library.engine')
+
+    # set on every request, the session may outlive one in tests
+    db.session.info['primary'] = primary
+    db.session.info['replica'] = None if replicas.reads_primary(request) \
+        else replicas.choose(asynchronous=primary is not None)
+
+
+@app.after_request
+def guard_own_writes(response):
+    replicas.remember_write(request, response)
+
+    return response
+
+
+@app.errorhandler(HashingUnavailable)
+def hashing_unavailable(exception):
+    # resources get this from flask-restful, this one covers /auth
+    response = jsonify(message=exception.description)
+    response.status_code = exception.code
+    response.headers.extend(exception.get_headers())
+    response.headers['Content-Type'] = 'application/json'
+
+    return response
+
+
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
 from library.models import User
+from services.cache import TTLCache
+
+identity_cache = TTLCache(app.config['IDENTITY_CACHE_SIZE'], app.config['IDENTITY_CACHE_TTL'])
 
 
 def authenticate(username, password):
@@ -69,9 +172,49 @@ def authenticate(username, password):
 
 def identity(payload):
     user_id = payload['identity']
+    user = identity_cache.get(user_id)
+
+    if user is not None:
+        return db.session.merge(user, load=False)
+
+    user = User.query.filter_by(id=user_id).first()
+
+    if user is not None:
+        # cache a detached copy, each request merges it into its own session
+        db.session.expunge(user)
+        identity_cache.set(user_id, user)
+        user = db.session.merge(user, load=False)
+
+    return user
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def collect_changed_identity(mapper, connection, target):
+    object_session(target).info.setdefault('changed_identities', set()).add(target.id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_changed_identities(session):
+    for user_id in session.info.pop('changed_identities', ()):
+        identity_cache.pop(user_id)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def forget_changed_identities(session, previous_transaction):
+    session.info.pop('changed_identities', None)
+
+
+@event.listens_for(db.session, 'after_begin')
+def limit_statements(session, transaction, connection):
+    if app.config['DATABASE_TRANSACTION_POOLER'] and app.config['DATABASE_STATEMENT_TIMEOUT']:
+        set_statement_timeout(connection, app.config['DATABASE_STATEMENT_TIMEOUT'])
+
 
-    return User.query.filter_by(id=user_id).first()
+from services.response_cache import ResponseCache
 
+response_cache = ResponseCache(app.config['RESPONSE_CACHE_SIZE'], app.config['RESPONSE_CACHE_TTL'])
+response_cache.watch(db.session)
 
 jwt = JWT(app, authenticate, identity)
 
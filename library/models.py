@@ -1,11 +1,25 @@
-from sqlalchemy.orm import validates
-from sqlalchemy.dialects.postgresql import ENUM as pgEnum
-from library import db, bcrypt
+from sqlalchemy.orm import validates, deferred
+from sqlalchemy.dialects.postgresql import ENUM as pgEnum, JSONB, TSVECTOR
+from library import db, hashing
 import datetime
 import enum
 import re
 
 
+SEARCH_CONFIG = 'english'
+
+
+def search_document(*weighted_columns):
+    """ SQL for a tsvector over ``(column, weight)`` pairs, for a generated column. """
+    return ' || '.join(f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({column}, '')), '{weight}')"
+                       for column, weight in weighted_columns)
+
+
+def search_vector(*weighted_columns):
+    # generated by Postgres, so every write path keeps it in sync; deferred as it is never dumped
+    return deferred(db.Column(TSVECTOR, db.Computed(search_document(*weighted_columns), persisted=True)))
+
+
 class TimestampMixin:
     created_at = db.Column(
         db.DateTime(), default=datetime.datetime.now)
@@ -30,14 +44,32 @@ class RatingEnum(enum.Enum):
 
 author_book = db.Table('author_book',
                        db.Column('author_id', db.Integer, db.ForeignKey('author.id', ondelete='CASCADE'), primary_key=True),
-                       db.Column('book_id', db.Integer, db.ForeignKey('book.id', ondelete='CASCADE'), primary_key=True))
+                       db.Column('book_id', db.Integer, db.ForeignKey('book.id', ondelete='CASCADE'), primary_key=True),
+                       # the primary key only serves lookups by author_id
+                       db.Index('ix_author_book_book_id', 'book_id'))
 
 
 class Author(TimestampMixin, db.Model):
     __tablename__ = 'author'
+    __table_args__ = (
+        db.Index('ix_author_lastname_id', 'lastname', 'id'),
+        db.Index('ix_author_country', 'country'),
+        db.Index('ix_author_rating', 'rating'),
+        db.Index('ix_author_created_at', 'created_at'),
+        db.Index('ix_author_search_vector', 'search_vector', postgresql_using='gin'),
+        # blob references are counted by picture
+        db.Index('ix_author_picture', 'picture'),
+    )
+    # query parameter -> column (or relationship.column) Pages.get may filter on
+    __filterable__ = {'country': 'country', 'rating': 'rating', 'created_at': 'created_at'}
+    __sortable__ = ('lastname',)
+    # columns /search highlights matches in
+    __searchable__ = ('firstname', 'lastname', 'biography')
 
     id = db.Column(db.Integer(), primary_key=True)
     picture = db.Column(db.Unicode(), nullable=True)
+    # variant name -> path, once the background task generated them
+    picture_variants = db.Column(JSONB, nullable=True)
     firstname = db.Column(db.Unicode(64), nullable=False)
     lastname = db.Column(db.Unicode(64), nullable=False)
     country = db.Column(db.Unicode(), nullable=True)
@@ -45,6 +77,7 @@ class Author(TimestampMixin, db.Model):
     biography = db.Column(db.Unicode(), nullable=False)
     rating = db.Column(pgEnum(RatingEnum, name="author_rating"), default=RatingEnum.zero)
     birthday = db.Column(db.DateTime(), nullable=True)
+    search_vector = search_vector(('firstname', 'A'), ('lastname', 'A'), ('biography', 'B'))
     books = db.relationship('Book', secondary=author_book, cascade="all, delete", lazy='subquery', backref=db.backref('authors', lazy=True))
 
 
@@ -66,9 +99,25 @@ class BookStatusEnum(enum.Enum):
 
 class Book(TimestampMixin, db.Model):
     __tablename__ = 'book'
+    __table_args__ = (
+        db.Index('ix_book_genre_id', 'genre_id'),
+        db.Index('ix_book_status', 'status'),
+        db.Index('ix_book_format', 'format'),
+        db.Index('ix_book_pages_id', 'pages', 'id'),
+        db.Index('ix_book_created_at', 'created_at'),
+        db.Index('ix_book_name_id', 'name', 'id'),
+        db.Index('ix_book_search_vector', 'search_vector', postgresql_using='gin'),
+        db.Index('ix_book_picture', 'picture'),
+    )
+    __filterable__ = {'genre_id': 'genre_id', 'status': 'status', 'format': 'format', 'pages': 'pages',
+                      'created_at': 'created_at', 'author_id': 'authors.id'}
+    __sortable__ = ('name', 'pages')
+    __searchable__ = ('name', 'description', 'publisher')
 
     id = db.Column(db.Integer(), primary_key=True)
     picture = db.Column(db.Unicode(), nullable=True)
+    # variant name -> path, once the background task generated them
+    picture_variants = db.Column(JSONB, nullable=True)
     name = db.Column(db.Unicode(255), nullable=False)
     isbn = db.Column(db.Unicode(17), nullable=False)
     description = db.Column(db.Unicode(), nullable=True)
@@ -80,6 +129,7 @@ class Book(TimestampMixin, db.Model):
     format = db.Column(pgEnum(BookFormatEnum, name='book_format'), default=BookFormatEnum.ebook, nullable=False)
     pages = db.Column(db.Integer(), default=1, nullable=False)
     genre_id = db.Column(db.Integer(), db.ForeignKey('genre.id', ondelete='CASCADE'), nullable=False)
+    search_vector = search_vector(('name', 'A'), ('description', 'B'), ('publisher', 'C'))
 
     @validates('count')
     def validate_count(self, key, count):
@@ -94,10 +144,15 @@ class UserRoleEnum(enum.Enum):
 
 class User(TimestampMixin, db.Model):
     __tablename__ = 'user'
+    __table_args__ = (
+        db.Index('ix_user_picture', 'picture'),
+    )
 
     id = db.Column(db.Integer(), primary_key=True)
     username = db.Column(db.Unicode(64), nullable=False, unique=True)
     picture = db.Column(db.Unicode(), nullable=True)
+    # variant name -> path, once the background task generated them
+    picture_variants = db.Column(JSONB, nullable=True)
     firstname = db.Column(db.Unicode(64), nullable=False)
     lastname = db.Column(db.Unicode(64), nullable=False)
     email = db.Column(db.Unicode(255), nullable=True)
@@ -122,14 +177,17 @@ class User(TimestampMixin, db.Model):
 
     @password.setter
     def password(self, password_to_hash):
-        self.__password = bcrypt.generate_password_hash(password_to_hash).decode('utf-8')
+        self.__password = hashing.generate_password_hash(password_to_hash).decode('utf-8')
 
     def check_password(self, password_to_check):
-        return bcrypt.check_password_hash(self.__password, str(password_to_check))
+        return hashing.check_password_hash(self.__password, password_to_check)
 
 
 class Order(TimestampMixin, db.Model):
     __tablename__ = 'order'
+    __table_args__ = (
+        db.Index('ix_order_user_id', 'user_id'),
+    )
 
     id = db.Column(db.Integer(), primary_key=True)
     user_id = db.Column(db.Integer(), db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
@@ -143,11 +201,20 @@ class OrderItemStatusEnum(enum.Enum):
 
 class OrderItem(TimestampMixin, db.Model):
     __tablename__ = 'order_item'
+    __table_args__ = (
+        db.Index('ix_order_item_order_id', 'order_id'),
+        db.Index('ix_order_item_book_id', 'book_id'),
+        db.Index('ix_order_item_status', 'status'),
+        db.Index('ix_order_item_end_at', 'end_at'),
+    )
+    __filterable__ = {'order_id': 'order_id', 'book_id': 'book_id', 'status': 'status', 'end_at': 'end_at'}
 
     id = db.Column(db.Integer(), primary_key=True)
     order_id = db.Column(db.Integer(), db.ForeignKey('order.id', ondelete='CASCADE'), nullable=False)
     book_id = db.Column(db.Integer(), db.ForeignKey('book.id', ondelete='CASCADE'), nullable=False)
     books_amount = db.Column(db.Integer(), default=1)
+    # set once checkout took the copies out of Book.count
+    reserved = db.Column(db.Boolean(), default=False, server_default=db.false(), nullable=False)
     status = db.Column(pgEnum(OrderItemStatusEnum, name='order_item_status'),
                        default=OrderItemStatusEnum.in_progress)
     end_at = db.Column(
@@ -156,6 +223,12 @@ class OrderItem(TimestampMixin, db.Model):
 
 class Review(TimestampMixin, db.Model):
     __tablename__ = 'review'
+    __table_args__ = (
+        db.Index('ix_review_book_id', 'book_id'),
+        db.Index('ix_review_user_id', 'user_id'),
+        db.Index('ix_review_created_at', 'created_at'),
+    )
+    __filterable__ = {'book_id': 'book_id', 'user_id': 'user_id', 'created_at': 'created_at'}
 
     id = db.Column(db.Integer(), primary_key=True)
     user_id = db.Column(db.Integer(), db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
@@ -166,7 +239,24 @@ class Review(TimestampMixin, db.Model):
 
 class ReviewImage(db.Model):
     __tablename__ = 'review_image'
+    __table_args__ = (
+        db.Index('ix_review_image_review_id', 'review_id'),
+        db.Index('ix_review_image_image', 'image'),
+    )
 
     id = db.Column(db.Integer(), primary_key=True)
     review_id = db.Column(db.Integer(), db.ForeignKey('review.id', ondelete='CASCADE'), nullable=False)
     image = db.Column(db.Unicode(), nullable=True)
+    image_variants = db.Column(JSONB, nullable=True)
+
+
+class Blob(db.Model):
+    """ Uploaded content, stored once under its sha256 however many pictures use it. """
+    __tablename__ = 'blob'
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    # relative to UPLOAD_FOLDER, the value picture columns hold
+    path = db.Column(db.Unicode(), nullable=False, unique=True)
+    size = db.Column(db.Integer(), nullable=False)
+    content_type = db.Column(db.Unicode(), nullable=True)
+    created_at = db.Column(db.DateTime(), default=datetime.datetime.now)
@@ -18,7 +18,8 @@ class ResourseAuth(Resource):
 
 # routes
 from library.views import Pages, Page, Picture, ChangePassword, \
-                            UserPages, ReviewImagesPage, ReviewImagePage
+                            UserPages, ReviewImagesPage, ReviewImagePage, OrderCheckout, Checkout, \
+                            Search, Stats, Media
 
 
 api.add_resource(Pages, '/books', '/',
@@ -69,6 +70,10 @@ api.add_resource(Pages, '/orders',
 api.add_resource(Page, '/orders/<int:id>',
                  endpoint='order',
                  resource_class_args=[Order, order_schema, 'Order'])
+api.add_resource(Checkout, '/orders/checkout',
+                 endpoint='checkout')
+api.add_resource(OrderCheckout, '/orders/<int:id>/checkout',
+                 endpoint='order-checkout')
 
 api.add_resource(Pages, '/order-items',
                  endpoint='order-items',
@@ -88,3 +93,13 @@ api.add_resource(ReviewImagesPage, '/reviews/<int:review_id>/review-images',
                  endpoint='review-images')
 api.add_resource(ReviewImagePage, '/reviews/<int:review_id>/review-images/<int:review_image_id>',
                  endpoint='review-image')
+
+api.add_resource(Search, '/search',
+                 endpoint='search',
+                 resource_class_args=[{'books': (Book, books_schema), 'authors': (Author, authors_schema)}])
+
+api.add_resource(Media, '/media/<path:path>',
+                 endpoint='media')
+
+api.add_resource(Stats, '/stats',
+                 endpoint='stats')
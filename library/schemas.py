@@ -1,6 +1,7 @@
 from library import ma, db
 from marshmallow_enum import EnumField
 from marshmallow import fields
+from services.links import URLFor
 from library.models import Author, Book, BookCoverEnum, BookStatusEnum, \
     BookFormatEnum, RatingEnum, Genre, Order, User, OrderItem, \
     OrderItemStatusEnum, UserRoleEnum, Review, ReviewImage
@@ -12,7 +13,9 @@ class BookSchemaForAuthor(ma.SQLAlchemyAutoSchema):
         load_instance = True
         sqla_session = db.session
         include_fk = True
+        exclude = ('search_vector',)
 
+    picture_variants = ma.auto_field(dump_only=True)
     cover = EnumField(BookCoverEnum, by_value=True)
     status = EnumField(BookStatusEnum, by_value=True)
     rating = EnumField(RatingEnum, by_value=True)
@@ -27,14 +30,16 @@ class AuthorSchema(ma.SQLAlchemyAutoSchema):
         load_instance = True
         sqla_session = db.session
         include_fk = True
+        exclude = ('search_vector',)
 
+    picture_variants = ma.auto_field(dump_only=True)
     rating = EnumField(RatingEnum, by_value=True)
     books = fields.List(fields.Nested(BookSchemaForAuthor))
 
     _links = ma.Hyperlinks(
         {
-            "self": ma.URLFor("author", values=dict(id="<id>")),
-            "collection": ma.URLFor("authors"),
+            "self": URLFor("author", values=dict(id="<id>")),
+            "collection": URLFor("authors"),
         }
     )
 
@@ -49,7 +54,9 @@ class AuthorSchemaForBook(ma.SQLAlchemyAutoSchema):
         include_fk = True
         load_instance = True
         sqla_session = db.session
+        exclude = ('search_vector',)
 
+    picture_variants = ma.auto_field(dump_only=True)
     rating = EnumField(RatingEnum, by_value=True)
 
 
@@ -61,7 +68,9 @@ class BookSchema(ma.SQLAlchemyAutoSchema):
         load_instance = True
         sqla_session = db.session
         include_fk = True
+        exclude = ('search_vector',)
 
+    picture_variants = ma.auto_field(dump_only=True)
     cover = EnumField(BookCoverEnum, by_value=True)
     status = EnumField(BookStatusEnum, by_value=True)
     rating = EnumField(RatingEnum, by_value=True)
@@ -70,8 +79,8 @@ class BookSchema(ma.SQLAlchemyAutoSchema):
 
     _links = ma.Hyperlinks(
         {
-            "self": ma.URLFor("book", values=dict(id="<id>")),
-            "collection": ma.URLFor("books"),
+            "self": URLFor("book", values=dict(id="<id>")),
+            "collection": URLFor("books"),
         }
     )
 
@@ -90,8 +99,8 @@ class GenreSchema(ma.SQLAlchemyAutoSchema):
 
     _links = ma.Hyperlinks(
         {
-            "self": ma.URLFor("genre", values=dict(id="<id>")),
-            "collection": ma.URLFor("genres"),
+            "self": URLFor("genre", values=dict(id="<id>")),
+            "collection": URLFor("genres"),
         }
     )
 
@@ -108,6 +117,7 @@ class OrderItemSchemaForOrder(ma.SQLAlchemyAutoSchema):
         sqla_session = db.session
 
     status = EnumField(OrderItemStatusEnum, by_value=True)
+    reserved = ma.auto_field(dump_only=True)
 
 
 class OrderSchemaForUser(ma.SQLAlchemyAutoSchema):
@@ -127,6 +137,8 @@ class ReviewImageSchema(ma.SQLAlchemyAutoSchema):
         load_instance = True
         sqla_session = db.session
 
+    image_variants = ma.auto_field(dump_only=True)
+
 
 review_image_schema = ReviewImageSchema()
 review_images_schema = ReviewImageSchema(many=True)
@@ -152,12 +164,13 @@ class UserSchema(ma.SQLAlchemyAutoSchema):
 
     _links = ma.Hyperlinks(
         {
-            "self": ma.URLFor("user", values=dict(id="<id>")),
-            "collection": ma.URLFor("users"),
+            "self": URLFor("user", values=dict(id="<id>")),
+            "collection": URLFor("users"),
         }
     )
 
     password = fields.String()
+    picture_variants = ma.auto_field(dump_only=True)
     role = EnumField(UserRoleEnum, by_value=True)
     orders = fields.List(fields.Nested(OrderSchemaForUser))
     reviews = fields.List(fields.Nested(ReviewSchemaForUser))
@@ -181,22 +194,25 @@ class OrderSchema(OrderSchemaForUser):
 
     _links = ma.Hyperlinks(
         {
-            "self": ma.URLFor("order", values=dict(id="<id>")),
-            "collection": ma.URLFor("orders"),
+            "self": URLFor("order", values=dict(id="<id>")),
+            "collection": URLFor("orders"),
         }
     )
 
 
 order_schema = OrderSchema()
 orders_schema = OrderSchema(many=True)
+# a checkout creates the order and its items, it never loads existing ones
+checkout_order_schema = OrderSchema(exclude=['id', 'items'])
+checkout_items_schema = OrderItemSchemaForOrder(many=True, exclude=['id', 'order_id'])
 
 
 class OrderItemSchema(OrderItemSchemaForOrder):
 
     _links = ma.Hyperlinks(
         {
-            "self": ma.URLFor("order-item", values=dict(id="<id>")),
-            "collection": ma.URLFor("order-items"),
+            "self": URLFor("order-item", values=dict(id="<id>")),
+            "collection": URLFor("order-items"),
         }
     )
 
@@ -209,8 +225,8 @@ class ReviewSchema(ReviewSchemaForUser):
 
     _links = ma.Hyperlinks(
         {
-            "self": ma.URLFor("review", values=dict(id="<id>")),
-            "collection": ma.URLFor("reviews"),
+            "self": URLFor("review", values=dict(id="<id>")),
+            "collection": URLFor("reviews"),
         }
     )
 
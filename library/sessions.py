@@ -0,0 +1,31 @@
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.sql.dml import UpdateBase
+
+
+class RoutingSession(SignallingSession):
+    """ Reads from ``info['replica']`` when the request set an engine there.
+
+    Flushes, ``INSERT``/``UPDATE``/``DELETE`` statements and locking reads
+    always go to the primary, which is ``info['primary']`` when set (the
+    asyncpg engine of the ASGI mode), else the app's engine.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('replica')
+        primary = self.info.get('primary')
+
+        if bind is not None:
+            return bind
+
+        if replica is None or self._flushing or isinstance(clause, UpdateBase) \
+                or getattr(clause, '_for_update_arg', None) is not None:
+            return primary if primary is not None else super().get_bind(mapper, clause)
+
+        return replica
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
@@ -1,17 +1,45 @@
-import os
-import shutil
-from flask import request
-from library import app, db
+from flask import redirect, request, url_for
+from flask_jwt import current_identity
+from flask_restful import abort
+from library import app, db, identity_cache, response_cache, background, storage, replicas
 from library.routes import ResourseAuth
 from services import allowed_file
 from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import undefer
 from marshmallow import ValidationError
-from library.models import User, ReviewImage, Review
+from library.models import User, ReviewImage, Review, Book, Order, OrderItem
 from library.schemas import user_schema, user_schema_with_password, \
-    review_image_schema, review_images_schema, password_schema
+    review_image_schema, review_images_schema, password_schema, order_schema, \
+    checkout_order_schema, checkout_items_schema
 from services import check_whether_the_instance_exist, check_whether_picture_exist
+from services.pagination import page_window, paginate, sort_keys, order
+from services.streaming import wants_stream, stream_query
+from services.loading import loading_profile
+from services.serializers import serialize
+from services.links import wants_links
+from services.fieldsets import sparse_schema
+from services.filtering import filter_query, sort_order
+from services.search import search
+from services.bulk import load_many, check_constraints, allocate_ids, create_many, reload_many, selection, column_values, \
+    update_values, update_where, update_row, delete_where, forget_rows
+from services.inventory import reserve, OutOfStock
+from services.variants import replace_upload, schedule_variants
+from services.blobs import store, collect_garbage, is_blob
+from services.uploads import IMAGE_COLUMNS
+from services.media import resolve, send_media
+from services.offload import offload
+from services.response_cache import cascaded
+from services.conditional import fingerprint, body_validators, is_not_modified, \
+    not_modified, validator_headers
+
+
+def cached_response(data, validators):
+    if is_not_modified(validators):
+        return not_modified(validators)
+
+    return data, 200, validator_headers(validators)
 
 
 class Pages(ResourseAuth):
@@ -23,13 +51,47 @@ class Pages(ResourseAuth):
         self.message_name = message_name
 
     def get(self):
-        instances = self.model.query.all()
+        schema = sparse_schema(self.scheme_many, request.args)
+        options = loading_profile(self.model, schema)
+        query = filter_query(self.model.query, self.model, self.scheme_many, request.args)
+        sort = sort_order(self.model, request.args)
 
-        return self.scheme_many.dump(instances)
+        if wants_stream(request):
+            return stream_query(query.options(*options), self.model, schema, wants_links(request),
+                                order(*sort_keys(self.model, sort)))
+
+        cache_key = response_cache.key(self.model, schema)
+        cached = response_cache.get(cache_key)
+
+        if cached is not None:
+            return cached_response(*cached)
+
+        window = page_window(query, self.model, request.args, sort)
+
+        if sort:
+            # the cursors need the sort column even when ?fields= leaves it out
+            options = options + [undefer(sort[0])]
+        validators = fingerprint(window.query, self.model, schema)
+
+        if validators and is_not_modified(validators):
+            return not_modified(validators)
+
+        instances, cursors = paginate(window, options)
+        data = dict(items=serialize(schema, instances, wants_links(request)), **cursors)
+
+        if validators is None:
+            validators = body_validators(data)
+
+        response_cache.set(cache_key, data, validators)
+
+        return cached_response(data, validators)
 
     def post(self):
         json_data = request.get_json(force=True)
 
+        if isinstance(json_data, list):
+            return self.post_many(json_data)
+
         try:
             instance = self.scheme.load(json_data)
 
@@ -45,6 +107,67 @@ class Pages(ResourseAuth):
             return {'exception': f'An exception occured while creating the {self.message_name}!'}, 400
 
 
+    def post_many(self, items):
+        if not items:
+            return {'exception': 'Nothing to create.'}, 400
+
+        if len(items) > app.config['BULK_MAX_ITEMS']:
+            return {'exception': f"At most {app.config['BULK_MAX_ITEMS']} items can be created at once."}, 400
+
+        loaded, errors = load_many(self.scheme, items)
+        loaded = check_constraints(self.model, loaded, errors)
+
+        if not loaded:
+            return {'errors': errors}, 400
+
+        try:
+            ids = create_many(self.model, [instance for index, instance in loaded])
+
+        except IntegrityError:
+            db.session.rollback()
+
+            return {'exception': f'An exception occured while creating the {self.message_name}s!'}, 400
+
+        instances = reload_many(self.model, self.scheme_many, ids)
+        data = {'items': serialize(self.scheme_many, instances, wants_links(request)), 'errors': errors}
+
+        return data, 207 if errors else 201
+
+    def patch(self):
+        json_data = request.get_json(force=True)
+
+        try:
+            condition = selection(self.model, self.scheme, json_data)
+            ids = update_where(self.model, condition, update_values(self.model, self.scheme, json_data.get('values')))
+            db.session.commit()
+
+        except ValidationError as ve:
+            return {'exception': ve.messages}, 400
+
+        except IntegrityError:
+            db.session.rollback()
+
+            return {'exception': f'An exception occured while updating the {self.message_name}s!'}, 400
+
+        forget_rows(self.model, ids)
+
+        return {'updated': len(ids), 'ids': ids}
+
+    def delete(self):
+        json_data = request.get_json(force=True)
+
+        try:
+            ids = delete_where(self.model, selection(self.model, self.scheme, json_data))
+            db.session.commit()
+
+        except ValidationError as ve:
+            return {'exception': ve.messages}, 400
+
+        forget_rows(self.model, ids, deleted=True)
+
+        return {'deleted': len(ids), 'ids': ids}
+
+
 class Page(ResourseAuth):
 
     def __init__(self, model, scheme, message_name, directory_name=None):
@@ -54,9 +177,28 @@ class Page(ResourseAuth):
         self.directory_name = directory_name
 
     def get(self, id):
-        instance = check_whether_the_instance_exist(self.model, id, f"{self.message_name} {id} doesn`t exist.")
+        schema = sparse_schema(self.scheme, request.args)
+        cache_key = response_cache.key(self.model, schema)
+        cached = response_cache.get(cache_key)
+
+        if cached is not None:
+            return cached_response(*cached)
+
+        validators = fingerprint(self.model.query.filter_by(id=id), self.model, schema, single=True)
+
+        if validators and is_not_modified(validators):
+            return not_modified(validators)
+
+        instance = check_whether_the_instance_exist(self.model, id, f"{self.message_name} {id} doesn`t exist.",
+                                                    loading_profile(self.model, schema))
+        data = serialize(schema, instance, wants_links(request))
+
+        if validators is None:
+            validators = body_validators(data)
 
-        return self.scheme.dump(instance)
+        response_cache.set(cache_key, data, validators)
+
+        return cached_response(data, validators)
 
     def put(self, id):
         check_whether_the_instance_exist(self.model, id, f"{self.message_name} {id} doesn`t exist.")
@@ -76,18 +218,50 @@ class Page(ResourseAuth):
         except IntegrityError:
             return {'exception': f'An exception occured while updating the {self.message_name.lower()}'}, 400
 
+    def patch(self, id):
+        json_data = request.get_json(force=True)
+
+        try:
+            instance = update_row(self.model, id, column_values(self.model, self.scheme, json_data))
+
+            if instance is None:
+                abort(404, message=f"{self.message_name} {id} doesn`t exist.")
+
+            # dump before the commit expires the returned row
+            data = serialize(self.scheme, instance, wants_links(request))
+            db.session.commit()
+
+        except ValidationError as ve:
+            return {'exception': ve.messages}, 400
+
+        except IntegrityError:
+            db.session.rollback()
+
+            return {'exception': f'An exception occured while updating the {self.message_name.lower()}'}, 400
+
+        forget_rows(self.model, [id])
+
+        return data
+
     def delete(self, id):
         instance = check_whether_the_instance_exist(self.model, id, f"{self.message_name} {id} doesn`t exist.")
 
         try:
-            if self.directory_name:
-                if instance.picture and os.path.isdir(
-                        os.path.join(app.config['UPLOAD_FOLDER'], self.directory_name, str(instance.id))):
-                    shutil.rmtree(os.path.join(app.config['UPLOAD_FOLDER'], self.directory_name, str(instance.id)))
+            picture = instance.picture if self.directory_name else None
+
+            # the folder of a picture uploaded before blobs
+            if picture and not is_blob(picture):
+                offload(storage.delete_prefix, f'{self.directory_name}/{instance.id}/')
 
             db.session.delete(instance)
             db.session.commit()
 
+            if (cascaded(self.model) - {self.model}) & IMAGE_COLUMNS.keys():
+                # the pictures of the rows deleted with it aren't known
+                background.submit(collect_garbage)
+            elif is_blob(picture):
+                background.submit(collect_garbage, [picture])
+
             return {'success': f'You successfully deleted the {self.message_name.lower()}!'}
 
         except:
@@ -102,6 +276,27 @@ class Picture(ResourseAuth):
         self.directory_name = directory_name
         self.schema = schema
 
+    def get(self, id):
+        instance = check_whether_the_instance_exist(self.model, id, f"{self.message_name} {id} doesn`t exist.")
+        column, variants_column = IMAGE_COLUMNS[self.model]
+        path = getattr(instance, column)
+
+        if path is None:
+            return {"exception": f"{self.message_name} {id} has no picture."}, 404
+
+        variant = request.args.get('variant')
+
+        if variant is not None and variant not in app.config['IMAGE_VARIANTS']:
+            return {"exception": f"Unknown variant {variant}."}, 400
+
+        # the original until the variant is rendered
+        path = (getattr(instance, variants_column) or {}).get(variant, path)
+
+        response = redirect(url_for('media', path=path))
+        response.cache_control.no_cache = True
+
+        return response
+
     def put(self, id):
         instance = check_whether_the_instance_exist(self.model, id, f"{self.message_name} {id} doesn`t exist.")
 
@@ -121,23 +316,16 @@ class Picture(ResourseAuth):
             if mimetype and mimetype not in app.config["ALLOWED_MIMETYPES_EXTENSIONS"]:
                 return {"exception": "File type not allowed, upload png, jpeg, svg files"}, 400
 
-            target = os.path.join(app.config['UPLOAD_FOLDER'], self.directory_name, str(instance.id))
-
-            if not os.path.exists(target):
-                os.makedirs(target)
-
-            target = os.path.join(self.directory_name, str(instance.id), filename)
-
-            uploaded_file.save(os.path.join(app.config['UPLOAD_FOLDER'], target))
-
-            if instance.picture and os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], instance.picture)):
-                os.remove(os.path.join(app.config['UPLOAD_FOLDER'], instance.picture))
-
-            instance.picture = target
+            previous = instance.picture
+            replace_upload(self.model, instance, store(uploaded_file, filename))
 
             db.session.add(instance)
             db.session.commit()
 
+            if is_blob(previous) and previous != instance.picture:
+                background.submit(collect_garbage, [previous])
+            schedule_variants(self.model, instance)
+
             return self.schema.dump(instance), 200
 
         return {'exception': 'An exception throwed while adding picture!'}, 400
@@ -216,32 +404,12 @@ class ReviewImagesPage(ResourseAuth):
             if mimetype and mimetype not in app.config["ALLOWED_MIMETYPES_EXTENSIONS"]:
                 return {"exception": "File type not allowed, upload png, jpeg, svg files"}, 400
 
-            review_image = ReviewImage(review_id=review_id)
+            review_image = ReviewImage(review_id=review_id, image=store(uploaded_file, filename))
 
             db.session.add(review_image)
             db.session.commit()
 
-            check_whether_picture_exist(review_id=review_id, instance=review_image)
-
-            target = os.path.join(app.config['UPLOAD_FOLDER'],
-                                  'review_images',
-                                  str(review_id),
-                                  str(review_image.id))
-
-            if not os.path.exists(target):
-                os.makedirs(target)
-
-            uploaded_file.save(os.path.join(target, filename))
-
-            target = os.path.join('review_images',
-                                  str(review_id),
-                                  str(review_image.id),
-                                  filename)
-
-            review_image.image = target
-
-            db.session.add(review_image)
-            db.session.commit()
+            schedule_variants(ReviewImage, review_image)
 
             return review_image_schema.dump(review_image), 200
 
@@ -271,28 +439,21 @@ class ReviewImagePage(ResourseAuth):
             if mimetype and mimetype not in app.config["ALLOWED_MIMETYPES_EXTENSIONS"]:
                 return {"exception": "File type not allowed, upload png, jpeg, svg files"}, 400
 
-            check_whether_picture_exist(review_id=review_id, instance=review_image)
-
-            target = os.path.join(app.config['UPLOAD_FOLDER'],
-                                  'review_images',
-                                  str(review_id),
-                                  str(review_image.id))
-
-            if not os.path.exists(target):
-                os.makedirs(target)
-
-            uploaded_file.save(os.path.join(target, filename))
-
-            target = os.path.join('review_images',
-                                  str(review_id),
-                                  str(review_image.id),
-                                  filename)
+            # the folder of an image uploaded before blobs
+            if review_image.image and not is_blob(review_image.image):
+                check_whether_picture_exist(review_id=review_id, instance=review_image)
 
-            review_image.image = target
+            previous = review_image.image
+            replace_upload(ReviewImage, review_image, store(uploaded_file, filename))
 
             db.session.add(review_image)
             db.session.commit()
 
+            if is_blob(previous) and previous != review_image.image:
+                background.submit(collect_garbage, [previous])
+
+            schedule_variants(ReviewImage, review_image)
+
             return review_image_schema.dump(review_image), 200
 
         return {'exception': 'An exception throwed while adding picture!'}, 400
@@ -302,18 +463,157 @@ class ReviewImagePage(ResourseAuth):
         review_image = check_whether_the_instance_exist(ReviewImage, review_image_id, f"Review Image {review_image_id} doesn`t exist.")
 
         try:
-            if review_image.image and os.path.isdir(
-                    os.path.join(app.config['UPLOAD_FOLDER'], 'review_images',
-                                  str(review_id),
-                                  str(review_image.id))):
-                shutil.rmtree(os.path.join(app.config['UPLOAD_FOLDER'], 'review_images',
-                                  str(review_id)))
+            image = review_image.image
+
+            if image and not is_blob(image):
+                check_whether_picture_exist(review_id=review_id, instance=review_image)
             db.session.delete(review_image)
             db.session.commit()
 
+            if is_blob(image):
+                background.submit(collect_garbage, [image])
+
             return {'success': f'You successfully deleted the review image!'}
 
         except:
             return {'exception': f'An exception throwed while deleting the review image!'}, 400
 
 
+class OrderCheckout(ResourseAuth):
+
+    def post(self, id):
+        # concurrent checkouts of the same order wait here, so its items are reserved once
+        order = Order.query.filter_by(id=id).with_for_update().first()
+
+        if order is None:
+            return {'exception': f"Order {id} doesn`t exist."}, 404
+
+        items = OrderItem.query.filter_by(order_id=id, reserved=False).all()
+        amounts = {}
+
+        for item in items:
+            if item.books_amount is None or item.books_amount < 1:
+                db.session.rollback()
+
+                return {'exception': f'Order item {item.id} has no books to reserve.'}, 400
+
+            amounts[item.book_id] = amounts.get(item.book_id, 0) + item.books_amount
+            item.reserved = True
+
+        try:
+            reserve(amounts)
+            db.session.commit()
+
+        except OutOfStock as e:
+            db.session.rollback()
+
+            return {'exception': e.description, 'books': e.books}, e.code
+
+        forget_rows(Book, list(amounts))
+
+        return serialize(order_schema, order, wants_links(request))
+
+
+class Checkout(ResourseAuth):
+
+    def post(self):
+        json_data = request.get_json(force=True)
+        cart = json_data.get('items') if isinstance(json_data, dict) else None
+
+        if not isinstance(cart, list) or not cart:
+            return {'exception': {'items': ['Provide the books to order.']}}, 400
+
+        if len(cart) > app.config['BULK_MAX_ITEMS']:
+            return {'exception': f"At most {app.config['BULK_MAX_ITEMS']} items can be ordered at once."}, 400
+
+        try:
+            order = checkout_order_schema.load({'user_id': current_identity.id,
+                                                **{key: value for key, value in json_data.items() if key != 'items'}})
+            items = checkout_items_schema.load(cart)
+
+        except ValidationError as ve:
+            return {'exception': ve.messages}, 400
+
+        amounts = {}
+
+        for index, item in enumerate(items):
+            if item.books_amount is None:
+                item.books_amount = 1
+
+            if item.books_amount < 1:
+                return {'exception': {'items': {index: {'books_amount': ['Must be at least 1.']}}}}, 400
+
+            amounts[item.book_id] = amounts.get(item.book_id, 0) + item.books_amount
+            item.reserved = True
+
+        try:
+            # ids up front, so the order and its items go out as two plain INSERTs
+            allocate_ids(Order, [order])
+            allocate_ids(OrderItem, items)
+            order.items = items
+
+            db.session.add(order)
+            db.session.flush()
+            reserve(amounts)
+
+            # dump before the commit expires what was just inserted
+            data = serialize(order_schema, order, wants_links(request))
+            db.session.commit()
+
+        except OutOfStock as e:
+            db.session.rollback()
+
+            return {'exception': e.description, 'books': e.books}, e.code
+
+        except IntegrityError:
+            db.session.rollback()
+
+            return {'exception': 'An exception occured while placing the order!'}, 400
+
+        forget_rows(Book, list(amounts))
+
+        return data, 201
+
+
+class Search(ResourseAuth):
+
+    def __init__(self, resources):
+        self.resources = resources
+
+    def get(self):
+        text = request.args.get('q', '').strip()
+
+        if not text:
+            return {'exception': 'Provide a search query with ?q=.'}, 400
+
+        names = [name.strip() for name in request.args.get('type', ','.join(self.resources)).split(',')]
+        unknown = [name for name in names if name not in self.resources]
+
+        if unknown:
+            return {'exception': f"Cannot search {', '.join(unknown)}."}, 400
+
+        resources = {name: self.resources[name] for name in names}
+        items, cursors = search(text, resources, request.args, wants_links(request))
+
+        return dict(items=items, **cursors)
+
+
+class Media(ResourseAuth):
+
+    def get(self, path):
+        media = resolve(path)
+        response = media and send_media(media)
+
+        if response is None:
+            return {"exception": f"Media {path} doesn`t exist."}, 404
+
+        return response
+
+
+class Stats(ResourseAuth):
+
+    def get(self):
+        primary = db.session.info.get('primary')
+
+        return {'identity_cache': identity_cache.stats(), 'response_cache': response_cache.stats(),
+                'database_pool': (primary or db.engine).pool.stats(), 'database_replicas': replicas.stats()}
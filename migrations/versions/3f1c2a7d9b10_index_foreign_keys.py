@@ -0,0 +1,78 @@
+"""Index foreign keys and hot lookup columns
+
+Revision ID: 3f1c2a7d9b10
+Revises:
+Create Date: 2026-10-18 09:12:41.208365
+
+Postgres doesn't index the referencing side of a foreign key, so relationship
+loads and ON DELETE CASCADE scanned the whole child table. The indexes are
+built CONCURRENTLY to keep the tables writable, and skipped where
+``flask db migrate`` already created them from the models.
+
+An empty database gets the whole schema from the models here instead, which
+every later revision then finds in place.
+
+"""
+from alembic import op
+from flask import current_app
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a7d9b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# name, table, columns; kept in step with the __table_args__ in library/models.py
+INDEXES = (
+    ('ix_author_book_book_id', 'author_book', ('book_id',)),
+    ('ix_book_genre_id', 'book', ('genre_id',)),
+    ('ix_order_user_id', 'order', ('user_id',)),
+    ('ix_order_item_order_id', 'order_item', ('order_id',)),
+    ('ix_order_item_book_id', 'order_item', ('book_id',)),
+    ('ix_review_book_id', 'review', ('book_id',)),
+    ('ix_review_user_id', 'review', ('user_id',)),
+    ('ix_review_image_review_id', 'review_image', ('review_id',)),
+    ('ix_author_lastname_id', 'author', ('lastname', 'id')),
+    ('ix_author_country', 'author', ('country',)),
+    ('ix_book_status', 'book', ('status',)),
+    ('ix_book_format', 'book', ('format',)),
+    ('ix_book_pages_id', 'book', ('pages', 'id')),
+    ('ix_book_created_at', 'book', ('created_at',)),
+    ('ix_book_name_id', 'book', ('name', 'id')),
+)
+
+
+def invalid_indexes():
+    """ Indexes left behind INVALID by an interrupted concurrent build. """
+    rows = op.get_bind().execute(sa.text(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE NOT i.indisvalid AND c.relname = ANY(:names)"), {'names': [name for name, *_ in INDEXES]})
+
+    return {name for name, in rows}
+
+
+def upgrade():
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if not tables - {'alembic_version'}:
+        current_app.extensions['migrate'].db.metadata.create_all(op.get_bind())
+        return
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        for name in invalid_indexes():
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+        for name, table, columns in INDEXES:
+            # a fresh database gets the tables, indexes included, from the models
+            if table in tables:
+                op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+                           f'ON "{table}" ({", ".join(columns)})')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
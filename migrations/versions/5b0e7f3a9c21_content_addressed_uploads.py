@@ -0,0 +1,52 @@
+"""Store uploads once per content hash
+
+Revision ID: 5b0e7f3a9c21
+Revises: d27a9e4c1f08
+Create Date: 2026-10-18 15:22:06.481733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b0e7f3a9c21'
+down_revision = 'd27a9e4c1f08'
+branch_labels = None
+depends_on = None
+
+# blob references are counted through these
+INDEXES = (
+    ('ix_book_picture', 'book', 'picture'),
+    ('ix_author_picture', 'author', 'picture'),
+    ('ix_user_picture', 'user', 'picture'),
+    ('ix_review_image_image', 'review_image', 'image'),
+)
+
+
+def upgrade():
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'blob' not in tables:
+        op.create_table('blob',
+                        sa.Column('sha256', sa.String(length=64), nullable=False),
+                        sa.Column('path', sa.Unicode(), nullable=False),
+                        sa.Column('size', sa.Integer(), nullable=False),
+                        sa.Column('content_type', sa.Unicode(), nullable=True),
+                        sa.Column('created_at', sa.DateTime(), nullable=True),
+                        sa.PrimaryKeyConstraint('sha256'),
+                        sa.UniqueConstraint('path'))
+
+    with op.get_context().autocommit_block():
+        for name, table, column in INDEXES:
+            # a fresh database gets the tables, indexes included, from the models
+            if table in tables:
+                op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON "{table}" ({column})')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, column in INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+    op.drop_table('blob')
@@ -0,0 +1,29 @@
+"""Mark order items whose copies checkout reserved
+
+Revision ID: 8c4e1b2f6a53
+Revises: 3f1c2a7d9b10
+Create Date: 2026-10-18 11:03:17.552194
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4e1b2f6a53'
+down_revision = '3f1c2a7d9b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    # a fresh database gets the table, column included, from the models
+    if inspector.has_table('order_item') and \
+            'reserved' not in {column['name'] for column in inspector.get_columns('order_item')}:
+        op.add_column('order_item', sa.Column('reserved', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade():
+    op.drop_column('order_item', 'reserved')
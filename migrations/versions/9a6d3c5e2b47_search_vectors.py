@@ -0,0 +1,55 @@
+"""Full-text search columns of books and authors
+
+Revision ID: 9a6d3c5e2b47
+Revises: 5b0e7f3a9c21
+Create Date: 2026-10-18 19:04:37.515208
+
+Adding a stored generated column rewrites the table under an exclusive lock;
+the GIN indexes are then built CONCURRENTLY.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a6d3c5e2b47'
+down_revision = '5b0e7f3a9c21'
+branch_labels = None
+depends_on = None
+
+# table, (column, weight) pairs; kept in step with the search_vector columns in library/models.py
+DOCUMENTS = (
+    ('book', (('name', 'A'), ('description', 'B'), ('publisher', 'C'))),
+    ('author', (('firstname', 'A'), ('lastname', 'A'), ('biography', 'B'))),
+)
+
+
+def search_document(weighted_columns):
+    return ' || '.join(f"setweight(to_tsvector('english', coalesce({column}, '')), '{weight}')"
+                       for column, weight in weighted_columns)
+
+
+def upgrade():
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    for table, weighted_columns in DOCUMENTS:
+        # a fresh database gets the tables, columns included, from the models
+        if table in tables:
+            op.execute(f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS search_vector tsvector '
+                       f'GENERATED ALWAYS AS ({search_document(weighted_columns)}) STORED')
+
+    with op.get_context().autocommit_block():
+        for table, weighted_columns in DOCUMENTS:
+            if table in tables:
+                op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{table}_search_vector '
+                           f'ON "{table}" USING gin (search_vector)')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table, weighted_columns in DOCUMENTS:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS ix_{table}_search_vector')
+
+    for table, weighted_columns in DOCUMENTS:
+        op.execute(f'ALTER TABLE "{table}" DROP COLUMN IF EXISTS search_vector')
@@ -0,0 +1,39 @@
+"""Record the generated variants of uploaded pictures
+
+Revision ID: d27a9e4c1f08
+Revises: 8c4e1b2f6a53
+Create Date: 2026-10-18 13:40:52.917310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd27a9e4c1f08'
+down_revision = '8c4e1b2f6a53'
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    ('book', 'picture_variants'),
+    ('author', 'picture_variants'),
+    ('user', 'picture_variants'),
+    ('review_image', 'image_variants'),
+)
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    for table, column in COLUMNS:
+        # a fresh database gets the tables, columns included, from the models
+        if table in tables and column not in {existing['name'] for existing in inspector.get_columns(table)}:
+            op.add_column(table, sa.Column(column, postgresql.JSONB(), nullable=True))
+
+
+def downgrade():
+    for table, column in COLUMNS:
+        op.drop_column(table, column)
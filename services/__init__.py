@@ -1,10 +1,9 @@
-import os
-import shutil
 from library import app, db
 from flask_restful import abort
 from flask import request
 from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
+from services.offload import offload
 
 
 def allowed_file(filename):
@@ -15,8 +14,8 @@ def allowed_file(filename):
     )
 
 
-def check_whether_the_instance_exist(model, id, message):
-    instance = model.query.filter_by(id=id).first()
+def check_whether_the_instance_exist(model, id, message, options=()):
+    instance = model.query.options(*options).filter_by(id=id).first()
 
     if not instance:
         abort(404, message=message)
@@ -25,11 +24,7 @@ def check_whether_the_instance_exist(model, id, message):
 
 
 def check_whether_picture_exist(review_id, instance):
-    if os.path.isdir(os.path.join(app.config['UPLOAD_FOLDER'],
-                                  'review_images',
-                                  str(review_id),
-                                  str(instance.id))):
-        shutil.rmtree(os.path.join(app.config['UPLOAD_FOLDER'],
-                               'review_images',
-                               str(review_id),
-                               str(instance.id)))
+    # library imports this package before it creates the storage
+    from library import storage
+
+    offload(storage.delete_prefix, f'review_images/{review_id}/{instance.id}/')
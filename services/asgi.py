@@ -0,0 +1,151 @@
+import io
+import itertools
+import sys
+from sqlalchemy.util import await_only, greenlet_spawn
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import FileWrapper
+from services.offload import offload
+
+
+class OffloadingFileWrapper(FileWrapper):
+    """ ``wsgi.file_wrapper`` reading the file in a thread, what ``send_file`` streams goes through it. """
+
+    def __next__(self):
+        data = offload(self.file.read, self.buffer_size)
+
+        if data:
+            return data
+
+        raise StopIteration()
+
+
+class AsgiApp:
+    """ Serves the WSGI ``app`` to an ASGI server, on asyncpg through ``engine``.
+
+    Every request runs the unchanged views in its own greenlet on the event
+    loop (SQLAlchemy's bridge between sync code and asyncio, the one
+    ``AsyncSession`` is built on): sessions use the sync facade of
+    ``engine``, so waiting for the database, and for file I/O handed to
+    ``offload``, lets other requests run.
+    """
+
+    def __init__(self, app, engine):
+        self.app = app
+        self.engine = engine
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope {scope['type']}")
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+
+                return
+
+    async def http(self, scope, receive, send):
+        app = self.app
+        body = bytearray()
+        limit = self.app.config['MAX_CONTENT_LENGTH']
+
+        while True:
+            message = await receive()
+
+            if message['type'] == 'http.disconnect':
+                return
+
+            body += message.get('body', b'')
+
+            # the rest isn't read, what the app would answer anyway
+            if limit is not None and len(body) > limit:
+                app = RequestEntityTooLarge()
+                break
+
+            if not message.get('more_body'):
+                break
+
+        await greenlet_spawn(self.call, app, self.environ(scope, bytes(body)), send)
+
+    def environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        root_path = scope.get('root_path', '')
+        path = scope['path'][len(root_path):] if scope['path'].startswith(root_path) else scope['path']
+
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            # WSGI strings are bytes decoded as latin-1
+            'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+            'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            # read in full, chunked bodies included
+            'wsgi.input_terminated': True,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': OffloadingFileWrapper,
+            # the primary of the request's session, see library.route_reads
+            'library.engine': self.engine.sync_engine,
+        }
+
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+
+            if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = 'HTTP_' + name
+
+            environ[name] = f'{environ[name]},{value}' if name in environ else value
+
+        return environ
+
+    def call(self, app, environ, send):
+        """ Run ``app`` and send its response, body iteration included, in the request's greenlet. """
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+
+            started[:] = [status, headers]
+
+        def start():
+            status, headers = started
+            await_only(send({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                             'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                         for name, value in headers]}))
+
+        iterable = app(environ, start_response)
+
+        try:
+            body = iter(iterable)
+            # streamed responses may only call start_response with their first chunk
+            first = next(body, b'')
+            start()
+
+            for chunk in itertools.chain((first,), body):
+                if chunk:
+                    await_only(send({'type': 'http.response.body', 'body': chunk, 'more_body': True}))
+
+            await_only(send({'type': 'http.response.body', 'body': b''}))
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
@@ -0,0 +1,42 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class Background:
+    """ Small thread pool for work that must not hold up the response (file cleanup and the like).
+
+    Tasks run inside their own application context. With ``workers=0`` they run inline.
+    """
+
+    def __init__(self, app, workers):
+        self.app = app
+        self.workers = workers
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _run(self, fn, *args):
+        with self.app.app_context():
+            try:
+                return fn(*args)
+            except Exception:
+                self.app.logger.exception('Background task %s failed', getattr(fn, '__name__', fn))
+
+    def submit(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='background')
+
+            future = self._executor.submit(self._run, fn, *args)
+            self._pending.add(future)
+
+        future.add_done_callback(self._pending.discard)
+
+        return future
+
+    def wait(self, timeout=None):
+        """ Block until every task submitted so far has finished. """
+        wait(list(self._pending), timeout=timeout)
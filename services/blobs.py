@@ -0,0 +1,109 @@
+import hashlib
+import os
+import tempfile
+from sqlalchemy import and_, delete, exists, func, insert, select
+from library import app, db, storage
+from library.models import Blob
+from services.offload import offload
+from services.uploads import IMAGE_COLUMNS
+
+BLOB_DIRECTORY = 'blobs'
+CHUNK_SIZE = 64 * 1024
+
+
+def blob_path(sha256, extension):
+    # two levels of 256 folders keep every directory small
+    return '/'.join((BLOB_DIRECTORY, sha256[:2], sha256[2:4], sha256 + extension))
+
+
+def is_blob(path):
+    return bool(path) and path.startswith(BLOB_DIRECTORY + '/')
+
+
+def lock(sha256):
+    """ Serialize storing and collecting the same content until the transaction ends. """
+    db.session.execute(select(func.pg_advisory_xact_lock(func.hashtext(sha256))))
+
+
+def unreferenced():
+    """ The condition of blobs no picture column refers to. """
+    return and_(*[~exists().where(getattr(model, column) == Blob.path)
+                  for model, (column, variants_column) in IMAGE_COLUMNS.items()])
+
+
+def receive(uploaded_file):
+    """ Stream ``uploaded_file`` to a local temporary file, hashing it on the way. Returns ``(path, sha256, size)``.
+
+    The content has to be hashed before its key is known, so it is kept
+    here rather than written to storage straight away.
+    """
+    directory = os.path.join(app.config['UPLOAD_FOLDER'], 'tmp')
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+
+    # in UPLOAD_FOLDER, so moving it into local storage is a rename
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as temporary:
+        for chunk in iter(lambda: uploaded_file.stream.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            temporary.write(chunk)
+            size += len(chunk)
+
+    return temporary.name, digest.hexdigest(), size
+
+
+def store(uploaded_file, filename):
+    """ Save an upload under the hash of its content and return its path; identical content is stored once.
+
+    The blob counts as used once a picture column holding the path is
+    committed, in the same transaction, which also holds the lock.
+    """
+    temporary, sha256, size = offload(receive, uploaded_file)
+
+    try:
+        lock(sha256)
+        path = db.session.execute(select(Blob.path).where(Blob.sha256 == sha256)).scalar()
+
+        if path is None:
+            path = blob_path(sha256, os.path.splitext(filename)[1].lower())
+            db.session.execute(insert(Blob).values(sha256=sha256, path=path, size=size,
+                                                   content_type=uploaded_file.content_type))
+
+        if not offload(storage.exists, path):
+            offload(storage.put_file, path, temporary, uploaded_file.content_type)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+    return path
+
+
+def remove_files(path):
+    """ Remove the blob at ``path`` and the variants rendered next to it. """
+    offload(storage.delete_prefix, os.path.splitext(path)[0] + '.')
+
+
+def collect_garbage(paths=None):
+    """ Delete the blobs no picture refers to any more, files and variants included.
+
+    Only the blobs at ``paths`` are looked at when given, e.g. the picture a
+    row just replaced or lost; ``None`` sweeps every blob, for deletes whose
+    cascades took pictures nobody listed.
+    """
+    candidates = select(Blob.sha256).where(unreferenced())
+
+    if paths is not None:
+        candidates = candidates.where(Blob.path.in_(paths))
+
+    for sha256 in db.session.execute(candidates).scalars().all():
+        lock(sha256)
+        # checked again under the lock, an upload may have taken it meanwhile
+        statement = delete(Blob).where(Blob.sha256 == sha256, unreferenced()).returning(Blob.path) \
+            .execution_options(synchronize_session=False)
+        path = db.session.execute(statement).scalar()
+
+        if path is not None:
+            # before the commit releases the lock, so a new upload of the same content can't lose its file
+            remove_files(path)
+
+        db.session.commit()
@@ -0,0 +1,281 @@
+from marshmallow import ValidationError
+from sqlalchemy import and_, delete, func, inspect, or_, select, update
+from library import db, background, identity_cache, response_cache
+from library.models import User
+from services.loading import loading_profile
+from services.response_cache import cascaded
+from services.blobs import collect_garbage
+from services.uploads import IMAGE_COLUMNS, UPLOAD_DIRECTORIES, sweep
+
+_transient_schemas = {}
+
+
+def load_many(scheme, items):
+    """ Load every item with ``scheme``, returning ``[(index, instance)]`` and ``{index: errors}``. """
+    loaded = []
+    errors = {}
+
+    for index, item in enumerate(items):
+        try:
+            loaded.append((index, scheme.load(item)))
+        except ValidationError as ve:
+            errors[index] = ve.messages
+        except (AssertionError, ValueError) as e:
+            # raised by the model validators
+            errors[index] = [str(e) or 'Invalid value.']
+
+    return loaded, errors
+
+
+def check_constraints(model, loaded, errors):
+    """ Move items breaking a foreign key or unique constraint from ``loaded`` to ``errors``, by index.
+
+    One query per foreign key and unique column, so a bad reference is
+    reported for its item instead of failing the whole insert.
+    """
+    mapper = inspect(model)
+    rejected = {}
+
+    for column in model.__table__.columns:
+        key = mapper.get_property_by_column(column).key
+        new = [(index, instance) for index, instance in loaded if inspect(instance).transient]
+
+        for fk in column.foreign_keys:
+            values = {getattr(instance, key) for index, instance in loaded} - {None}
+            existing = set(db.session.execute(select(fk.column).where(fk.column.in_(values))).scalars()) \
+                if values else set()
+
+            for index, instance in loaded:
+                if getattr(instance, key) not in existing | {None}:
+                    rejected.setdefault(index, {})[key] = ['Related row does not exist.']
+
+        if column.unique or column.primary_key:
+            new_values = {getattr(instance, key) for index, instance in new} - {None}
+            taken = set(db.session.execute(select(column).where(column.in_(new_values))).scalars()) \
+                if new_values else set()
+
+            for index, instance in new:
+                value = getattr(instance, key)
+
+                if value is None:
+                    continue
+
+                if value in taken:
+                    rejected.setdefault(index, {})[key] = ['Already exists.']
+
+                taken.add(value)
+
+    errors.update(rejected)
+
+    return [(index, instance) for index, instance in loaded if index not in rejected]
+
+
+def allocate_ids(model, instances):
+    """ Take ids for new instances from the table's sequence in one round trip.
+
+    Without ids the ORM has to INSERT ... RETURNING row by row, with them
+    it sends the whole batch as a single executemany.
+    """
+    pending = [instance for instance in instances if instance.id is None and inspect(instance).transient]
+
+    if not pending:
+        return
+
+    sequence = func.pg_get_serial_sequence(model.__table__.name, 'id')
+    ids = db.session.execute(select(func.nextval(sequence)).select_from(func.generate_series(1, len(pending))))
+
+    for instance, id in zip(pending, ids.scalars()):
+        instance.id = id
+
+
+def create_many(model, instances):
+    """ Insert ``instances`` in one transaction and return their ids. """
+    allocate_ids(model, instances)
+    # read before commit expires the instances
+    ids = [instance.id for instance in instances]
+
+    db.session.add_all(instances)
+    db.session.commit()
+
+    return ids
+
+
+def reload_many(model, schema, ids):
+    """ Load ``ids`` with ``schema``'s loading profile in one query, in the given order. """
+    instances = model.query.options(*loading_profile(model, schema)).filter(model.id.in_(ids)).all()
+    by_id = {instance.id: instance for instance in instances}
+
+    return [by_id[id] for id in ids if id in by_id]
+
+
+def selection(model, scheme, body):
+    """ The WHERE clause for a bulk request: ``{"ids": [...]}`` and/or ``{"filter": {column: value(s)}}``. """
+    if not isinstance(body, dict):
+        raise ValidationError(['Must be an object.'])
+
+    conditions = []
+    ids = body.get('ids')
+    filters = body.get('filter') or {}
+
+    if ids is not None:
+        if not isinstance(ids, list) or not ids or not all(isinstance(id, int) for id in ids):
+            raise ValidationError({'ids': ['Must be a non-empty list of integers.']})
+
+        conditions.append(model.id.in_(ids))
+
+    if not isinstance(filters, dict):
+        raise ValidationError({'filter': ['Must be an object.']})
+
+    columns = inspect(model).column_attrs
+    errors = {}
+
+    for name, value in filters.items():
+        field = scheme.fields.get(name)
+        attribute = (field.attribute or name) if field else None
+
+        if field is None or field.load_only or attribute not in columns:
+            errors[name] = ['Unknown column.']
+            continue
+
+        values = value if isinstance(value, list) else [value]
+
+        try:
+            values = [None if value is None else field.deserialize(value) for value in values]
+        except ValidationError as ve:
+            errors[name] = ve.messages
+            continue
+
+        column = getattr(model, attribute)
+        condition = column.in_([value for value in values if value is not None])
+
+        if None in values:
+            condition = or_(condition, column.is_(None))
+
+        conditions.append(condition)
+
+    if errors:
+        raise ValidationError({'filter': errors})
+
+    if not conditions:
+        raise ValidationError({'ids': ['Provide ids or a filter.']})
+
+    return and_(*conditions)
+
+
+def transient_schema(scheme):
+    """ A copy of ``scheme`` that builds new instances instead of looking them up.
+
+    ``load(transient=True)`` would leave the flag set on the shared schema, turning its later loads into inserts.
+    """
+    if scheme not in _transient_schemas:
+        _transient_schemas[scheme] = type(scheme)(transient=True, exclude=scheme.exclude)
+
+    return _transient_schemas[scheme]
+
+
+def column_values(model, scheme, values):
+    """ Validate ``values`` like a partial PUT and return them keyed by column. """
+    if not isinstance(values, dict) or not values:
+        raise ValidationError(['Must be a non-empty object.'])
+
+    columns = inspect(model).column_attrs
+    attributes = {}
+
+    for name in values:
+        field = scheme.fields.get(name)
+        attribute = (field.attribute or name) if field else None
+
+        if field is None or attribute not in columns or attribute == 'id':
+            raise ValidationError({name: ['Cannot be updated.']})
+
+        attributes[name] = attribute
+
+    try:
+        # the transient instance runs the model validators as well
+        instance = transient_schema(scheme).load(values, partial=True)
+    except (AssertionError, ValueError) as e:
+        raise ValidationError([str(e) or 'Invalid value.'])
+
+    return {attribute: getattr(instance, attribute) for attribute in attributes.values()}
+
+
+def update_values(model, scheme, values):
+    """ ``column_values`` for the ``values`` of a bulk PATCH. """
+    try:
+        return column_values(model, scheme, values)
+    except ValidationError as ve:
+        raise ValidationError({'values': ve.messages})
+
+
+def orm_cascades(model):
+    """ ``(relationship, target)`` pairs the ORM deletes along with ``model`` but the database doesn't. """
+    for relationship in inspect(model).relationships:
+        if not relationship.cascade.delete:
+            continue
+
+        if relationship.secondary is None and all(
+                column.foreign_keys and all(fk.ondelete and fk.ondelete.upper() == 'CASCADE'
+                                            for fk in column.foreign_keys)
+                for local, column in relationship.synchronize_pairs):
+            continue
+
+        yield relationship, relationship.mapper.class_
+
+
+def delete_where(model, condition):
+    """ DELETE the rows matching ``condition`` and everything the ORM would cascade to. Returns the ids. """
+    selected = select(model.id).where(condition)
+
+    for relationship, target in orm_cascades(model):
+        if relationship.secondary is not None:
+            (local, own), = relationship.synchronize_pairs
+            (remote, other), = relationship.secondary_synchronize_pairs
+            target_ids = select(other).where(own.in_(selected))
+        else:
+            (local, remote), = relationship.synchronize_pairs
+            target_ids = select(target.id).where(remote.in_(selected))
+
+        delete_where(target, target.id.in_(target_ids))
+
+    statement = delete(model).where(condition).returning(model.id) \
+        .execution_options(synchronize_session=False)
+
+    return list(db.session.execute(statement).scalars())
+
+
+def update_where(model, condition, values):
+    """ UPDATE the rows matching ``condition`` in one statement. Returns the ids. """
+    statement = update(model).where(condition).values(values).returning(model.id) \
+        .execution_options(synchronize_session=False)
+
+    return list(db.session.execute(statement).scalars())
+
+
+def update_row(model, id, values):
+    """ UPDATE row ``id`` and load it from the RETURNING clause, in one statement. ``None`` if it doesn't exist. """
+    # deferred columns are never dumped
+    columns = [prop.columns[0] for prop in inspect(model).column_attrs if not prop.deferred]
+    statement = update(model).where(model.id == id).values(values).returning(*columns)
+
+    # refresh the instance if the session already holds it
+    return db.session.execute(select(model).from_statement(statement).execution_options(populate_existing=True)) \
+        .scalars().first()
+
+
+def forget_rows(model, ids, deleted=False):
+    """ Invalidate what the caches hold for rows changed behind the ORM's back and sweep deleted uploads. """
+    if deleted:
+        response_cache.invalidate_deleted(model)
+    else:
+        response_cache.invalidate(model)
+
+    if issubclass(model, User):
+        for id in ids:
+            identity_cache.pop(id)
+
+    if deleted and ids:
+        for related in cascaded(model) & UPLOAD_DIRECTORIES.keys():
+            background.submit(sweep, related)
+
+        if cascaded(model) & IMAGE_COLUMNS.keys():
+            background.submit(collect_garbage)
@@ -0,0 +1,122 @@
+import datetime
+import hashlib
+import json
+from collections import namedtuple
+from flask import request, Response
+from sqlalchemy import func, inspect, literal, literal_column, select, union_all
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from werkzeug.http import http_date, quote_etag
+from library import db
+from services.loading import nested_schema
+
+Validators = namedtuple('Validators', 'etag last_modified')
+
+
+def timestamp(model):
+    if hasattr(model, 'created_at') and hasattr(model, 'updated_at'):
+        return func.coalesce(model.updated_at, model.created_at)
+
+    return None
+
+
+def related_paths(model, schema, path=()):
+    """ Yield the relationship paths ``schema`` dumps, e.g. ``(User.orders, Order.items)``. """
+    relationships = inspect(model).relationships
+
+    for name, field in schema.dump_fields.items():
+        nested = nested_schema(field)
+        attribute = field.attribute or name
+
+        if nested is None or attribute not in relationships:
+            continue
+
+        related_path = path + (getattr(model, attribute),)
+
+        yield related_path
+        yield from related_paths(relationships[attribute].mapper.class_, nested, related_path)
+
+
+def make_etag(*parts):
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+
+def pairs_digest(parent, child):
+    """ md5 of the ``parent.id:child.id`` pairs in a fixed order, which changes whenever a link does. """
+    pair = func.concat(parent.id, ':', child.id)
+
+    return func.md5(func.string_agg(pair, aggregate_order_by(literal_column("','"), parent.id, child.id)))
+
+
+def fingerprint(query, model, schema, single=False):
+    """ Validators computed from one aggregate query over the rows ``query`` selects.
+
+    The row count, newest ``updated_at``/``created_at`` and a digest of the
+    ids of the rows, and of every related row ``schema`` embeds paired with
+    its parent's id, change whenever the response would (relinking rows
+    through an association table too), so an unchanged page is answered
+    without loading it. Returns ``None`` when some dumped model has no timestamps.
+
+    Only the ETag covers deletes and relinks, which leave the newest
+    timestamp as it was, so ``last_modified`` is only given for a ``single``
+    row dumped without relationships.
+    """
+    paths = list(related_paths(model, schema))
+    models = [model] + [path[-1].property.mapper.class_ for path in paths]
+
+    if any(timestamp(related) is None for related in models):
+        return None
+
+    window = query.with_entities(model.id.label('id')).cte('window')
+    window_ids = select(window.c.id)
+
+    parts = [select(literal(0), func.count(), pairs_digest(model, model), func.max(timestamp(model)))
+             .where(model.id.in_(window_ids))]
+
+    for index, path in enumerate(paths, 1):
+        parent = path[-1].class_
+        target = path[-1].property.mapper.class_
+        part = select(literal(index), func.count(), pairs_digest(parent, target), func.max(timestamp(target))) \
+            .select_from(model)
+
+        for attribute in path:
+            part = part.join(attribute)
+
+        parts.append(part.where(model.id.in_(window_ids)))
+
+    rows = sorted(tuple(row) for row in db.session.execute(union_all(*parts)))
+    timestamps = [row[3] for row in rows if row[3] is not None]
+
+    last_modified = max(timestamps) if single and not paths and timestamps else None
+
+    return Validators(make_etag(request.full_path, rows), last_modified)
+
+
+def body_validators(data, last_modified=None):
+    body = json.dumps(data, sort_keys=True, default=str)
+
+    return Validators(make_etag(request.full_path, body), last_modified)
+
+
+def is_not_modified(validators):
+    if request.if_none_match:
+        return request.if_none_match.contains(validators.etag)
+
+    if request.if_modified_since and validators.last_modified:
+        last_modified = validators.last_modified.astimezone(datetime.timezone.utc).replace(microsecond=0)
+
+        return last_modified <= request.if_modified_since
+
+    return False
+
+
+def validator_headers(validators):
+    headers = {'ETag': quote_etag(validators.etag)}
+
+    if validators.last_modified:
+        headers['Last-Modified'] = http_date(validators.last_modified.astimezone(datetime.timezone.utc))
+
+    return headers
+
+
+def not_modified(validators):
+    return Response(status=304, headers=validator_headers(validators))
@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+from flask_restful import abort
+from library import app
+from services import loading, response_cache, serializers
+from services.loading import nested_schema
+
+_variants = OrderedDict()
+_lock = threading.Lock()
+
+
+def split(value):
+    return tuple(sorted({name.strip() for name in value.split(',') if name.strip()}))
+
+
+def sparse_schema(schema, args):
+    """ The variant of ``schema`` limited by ``?fields=`` (columns) and ``?include=`` (relationships).
+
+    ``id`` and ``_links`` are always dumped. Without ``fields`` every column
+    is dumped; without ``include`` no relationship is, unless neither is given.
+    Variants are built once, so they get their own compiled serializer and
+    loading profile (which only selects the dumped columns).
+    """
+    if 'fields' not in args and 'include' not in args:
+        return schema
+
+    requested = split(args['fields']) if 'fields' in args else None
+    included = split(args.get('include', ''))
+    key = (schema, requested, included)
+
+    with _lock:
+        variant = _variants.get(key)
+
+        if variant is not None:
+            _variants.move_to_end(key)
+
+            return variant
+
+    variant = build_variant(schema, requested, included)
+
+    with _lock:
+        _variants[key] = variant
+
+        # the combinations are the power set of the columns, keep only the recently used ones
+        while len(_variants) > app.config['SPARSE_SCHEMA_CACHE_SIZE']:
+            forget(_variants.popitem(last=False)[1])
+
+    return variant
+
+
+def schema_tree(schema):
+    """ ``schema`` and every schema nested in it. """
+    found = {schema}
+
+    for field in schema.dump_fields.values():
+        nested = nested_schema(field)
+
+        if nested is not None:
+            found |= schema_tree(nested)
+
+    return found
+
+
+def forget(variant):
+    """ Release what the per-schema caches built for an evicted variant. """
+    schemas = schema_tree(variant)
+
+    serializers.forget(schemas)
+    loading.forget(schemas)
+    response_cache.forget(schemas)
+
+
+def build_variant(schema, requested, included):
+    columns = {name for name, field in schema.dump_fields.items() if nested_schema(field) is None}
+    relationships = set(schema.dump_fields) - columns
+
+    unknown = sorted(set(requested or ()) - columns) + sorted(set(included) - relationships)
+
+    if unknown:
+        abort(400, message=f"Unknown fields: {', '.join(unknown)}.")
+
+    only = set(columns if requested is None else requested) | set(included)
+    only |= {'id', '_links'} & columns
+
+    return type(schema)(many=schema.many, only=only, exclude=schema.exclude)
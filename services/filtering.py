@@ -0,0 +1,104 @@
+from flask_restful import abort
+from marshmallow import ValidationError
+from marshmallow_sqlalchemy import ModelConverter
+from sqlalchemy import inspect, select
+
+# query parameters that are not filters
+RESERVED = {'limit', 'after', 'before', 'stream', 'links', 'fields', 'include', 'sort'}
+
+OPERATORS = {
+    'eq': lambda column, values: column == values[0],
+    'in': lambda column, values: column.in_(values),
+    'gt': lambda column, values: column > values[0],
+    'gte': lambda column, values: column >= values[0],
+    'lt': lambda column, values: column < values[0],
+    'lte': lambda column, values: column <= values[0],
+}
+
+_filters = {}
+
+
+def resolve(model, schema, path):
+    """ ``(field, condition factory)`` for an allow-listed ``column`` or ``relationship.column`` path. """
+    name, _, target = path.partition('.')
+
+    if not target:
+        field = schema.fields.get(name)
+
+        if field is None:
+            field = ModelConverter().property2field(inspect(model).column_attrs[name])
+
+        return field, lambda make: make(getattr(model, name))
+
+    relationship = inspect(model).relationships[name]
+    target_model = relationship.mapper.class_
+    field = ModelConverter().property2field(inspect(target_model).column_attrs[target])
+    column = getattr(target_model, target).property.columns[0]
+
+    if relationship.secondary is not None:
+        secondary = {remote: own for remote, own in relationship.secondary_synchronize_pairs}
+
+        if column in secondary:
+            # filter on the association table alone, without joining the target
+            (local, own), = relationship.synchronize_pairs
+
+            return field, lambda make: local.in_(select(own).where(make(secondary[column])))
+
+    return field, lambda make: getattr(model, name).any(make(getattr(target_model, target)))
+
+
+def filter_query(query, model, schema, args):
+    """ Apply ``?<name>[__<operator>]=<value>`` filters allow-listed in ``model.__filterable__``.
+
+    Operators are ``eq`` (the default), ``in`` (comma separated values),
+    ``gt``, ``gte``, ``lt`` and ``lte``; every filter must hold.
+    """
+    filterable = getattr(model, '__filterable__', {})
+    errors = {}
+
+    for key in args:
+        if key in RESERVED:
+            continue
+
+        name, _, operator = key.partition('__')
+        operator = operator or 'eq'
+
+        if name not in filterable or operator not in OPERATORS:
+            errors[key] = ['Unknown filter.']
+            continue
+
+        cache_key = (model, schema, name)
+
+        if cache_key not in _filters:
+            _filters[cache_key] = resolve(model, schema, filterable[name])
+
+        field, condition = _filters[cache_key]
+
+        for raw in args.getlist(key):
+            try:
+                values = [field.deserialize(value) for value in (raw.split(',') if operator == 'in' else [raw])]
+            except ValidationError as ve:
+                errors[key] = ve.messages
+                continue
+
+            query = query.filter(condition(lambda column: OPERATORS[operator](column, values)))
+
+    if errors:
+        abort(400, message=errors)
+
+    return query
+
+
+def sort_order(model, args):
+    """ ``(column, descending)`` from ``?sort=<name>`` or ``?sort=-<name>``, ``None`` for the default id order. """
+    sort = args.get('sort')
+
+    if not sort:
+        return None
+
+    name = sort.lstrip('-')
+
+    if name != 'id' and name not in getattr(model, '__sortable__', ()):
+        abort(400, message=f'Cannot sort by {name}.')
+
+    return getattr(model, name), sort.startswith('-')
@@ -0,0 +1,83 @@
+import hmac
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+import bcrypt
+from werkzeug.exceptions import ServiceUnavailable
+from services.offload import wait
+
+
+class HashingUnavailable(ServiceUnavailable):
+    description = 'Too many password operations in progress, try again later.'
+
+
+def hash_password(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def check_password(pw_hash, password):
+    return hmac.compare_digest(bcrypt.hashpw(password, pw_hash), pw_hash)
+
+
+class HashingService:
+    """ Runs bcrypt in a bounded process pool instead of on the request thread.
+
+    At most ``workers + queue_depth`` operations are in flight, past that (or
+    when an operation takes longer than ``timeout``) ``HashingUnavailable``
+    is raised, which is answered with 503 and ``Retry-After``. With
+    ``workers=0`` bcrypt runs inline.
+    """
+
+    def __init__(self, workers, queue_depth, timeout, retry_after, rounds=12):
+        self.workers = workers
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.rounds = rounds
+        self.queue_depth = queue_depth
+        self._slots = None
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            # a forked web worker must not reuse its parent's pool
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._slots = threading.BoundedSemaphore(self.workers + self.queue_depth)
+                self._pid = os.getpid()
+
+            return self._executor
+
+    def run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+
+        executor = self._get_executor()
+        slots = self._slots
+
+        if not slots.acquire(blocking=False):
+            raise HashingUnavailable(retry_after=self.retry_after)
+
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            slots.release()
+            raise
+
+        future.add_done_callback(lambda _: slots.release())
+
+        try:
+            return wait(future, self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashingUnavailable(retry_after=self.retry_after)
+
+    def generate_password_hash(self, password):
+        if not password:
+            raise ValueError('Password must be non-empty.')
+
+        return self.run(hash_password, str(password).encode('utf-8'), self.rounds)
+
+    def check_password_hash(self, pw_hash, password):
+        return self.run(check_password, pw_hash.encode('utf-8'), str(password).encode('utf-8'))
@@ -0,0 +1,52 @@
+from sqlalchemy import Integer, case, func, literal, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from werkzeug.exceptions import Conflict
+from library import db
+from library.models import Book, BookStatusEnum
+
+
+class OutOfStock(Conflict):
+    description = 'Not enough copies in stock.'
+
+    def __init__(self, books):
+        super().__init__()
+        self.books = books
+
+
+def reserve(amounts):
+    """ Take ``{book_id: amount}`` copies out of stock, all or none, in the current transaction.
+
+    Every book is decremented by one conditional UPDATE (``count >= amount``),
+    so concurrent checkouts can't oversell. With several books the rows are
+    locked in id order first, so carts sharing books queue instead of
+    deadlocking. Books left without copies become unavailable. Raises
+    ``OutOfStock`` with the books that are short, the caller rolls back.
+    """
+    ids = sorted(id for id, amount in amounts.items() if amount)
+
+    if not ids:
+        return
+
+    if len(ids) > 1:
+        # NO KEY UPDATE, like the UPDATE itself, so inserting order items for these books isn't blocked
+        db.session.execute(select(Book.id).where(Book.id.in_(ids)).order_by(Book.id)
+                           .with_for_update(key_share=True))
+
+    # arrays rather than VALUES rows keep the statement the same, and compiled once, for any cart
+    requested = func.unnest(literal(ids, ARRAY(Integer)), literal([amounts[id] for id in ids], ARRAY(Integer))) \
+        .table_valued('id', 'amount').render_derived(name='requested')
+    remaining = Book.count - requested.c.amount
+
+    statement = update(Book) \
+        .where(Book.id == requested.c.id, Book.count >= requested.c.amount) \
+        .values(count=remaining,
+                status=case((remaining == 0, literal(BookStatusEnum.unavailable, Book.status.type)),
+                            else_=Book.status)) \
+        .returning(Book.id) \
+        .execution_options(synchronize_session=False)
+
+    reserved = set(db.session.execute(statement).scalars())
+    short = [id for id in ids if id not in reserved]
+
+    if short:
+        raise OutOfStock(short)
@@ -0,0 +1,113 @@
+from flask import url_for, request, has_request_context
+from flask_marshmallow.fields import URLFor as BaseURLFor, _tpl
+from marshmallow import missing
+
+# ints that can't show up anywhere else in a built url, used to find where
+# each dynamic value goes in the url template
+SENTINEL = 1073741789
+
+
+def wants_links(request):
+    return request.args.get('links', '1').lower() not in ('0', 'false', 'no')
+
+
+def url_template(endpoint, static_values, names):
+    """ Return the url of ``endpoint`` split around its ``names`` values.
+
+    Returns ``None`` when the url can't be templated.
+    """
+    tokens = {name: str(SENTINEL + index) for index, name in enumerate(names)}
+    url = url_for(endpoint, **static_values, **{name: int(token) for name, token in tokens.items()})
+
+    if any(url.count(token) != 1 for token in tokens.values()):
+        return None
+
+    template = []
+    ordered = sorted(names, key=lambda name: url.index(tokens[name]))
+
+    for name in ordered:
+        before, url = url.split(tokens[name])
+        template.append(before)
+
+    template.append(url)
+
+    return tuple(template), tuple(ordered)
+
+
+def compile_url(url_field):
+    """ Build a ``build(obj)`` function equivalent to ``url_field.serialize``.
+
+    The url is built with werkzeug once per script root, every later url is
+    the cached template joined with the row's values.
+    """
+    static_values = {}
+    dynamic_values = []
+
+    for name, attr_tpl in url_field.values.items():
+        attr = _tpl(str(attr_tpl))
+
+        if attr is None:
+            static_values[name] = attr_tpl
+        elif '.' in attr:
+            return None
+        else:
+            dynamic_values.append((name, attr))
+
+    endpoint = url_field.endpoint
+    names = tuple(name for name, attr in dynamic_values)
+    external = bool(static_values.get('_external'))
+    templates = {}
+
+    def build(obj):
+        values = {}
+
+        for name, attr in dynamic_values:
+            value = getattr(obj, attr, missing)
+
+            if value is None:
+                return None
+
+            if value is missing:
+                raise AttributeError(f"{attr!r} is not a valid attribute of {obj!r}")
+
+            values[name] = value
+
+        if has_request_context():
+            key = (request.script_root, request.host_url if external else None)
+        else:
+            key = None
+
+        if key not in templates:
+            templates[key] = url_template(endpoint, static_values, names)
+
+        template = templates[key]
+
+        if template is None or any(type(value) is not int for value in values.values()):
+            return url_for(endpoint, **static_values, **values)
+
+        parts, ordered = template
+
+        if not ordered:
+            return parts[0]
+
+        url = parts[0]
+
+        for name, part in zip(ordered, parts[1:]):
+            url += str(values[name]) + part
+
+        return url
+
+    return build
+
+
+class URLFor(BaseURLFor):
+    """ ``URLFor`` building its urls from a cached per endpoint template. """
+
+    def _serialize(self, value, key, obj):
+        if not hasattr(self, '_build'):
+            self._build = compile_url(self)
+
+        if self._build is None:
+            return super()._serialize(value, key, obj)
+
+        return self._build(obj)
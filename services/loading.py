@@ -0,0 +1,78 @@
+from marshmallow import fields
+from sqlalchemy import inspect
+from sqlalchemy.orm import selectinload, lazyload, load_only
+
+_profiles = {}
+
+
+def nested_schema(field):
+    if isinstance(field, fields.List):
+        field = field.inner
+
+    if isinstance(field, fields.Nested):
+        return field.schema
+
+    return None
+
+
+def build_options(model, schema, parent=None):
+    mapper = inspect(model)
+    relationships = mapper.relationships
+    dumped = {}
+    columns = set()
+
+    for name, field in schema.dump_fields.items():
+        nested = nested_schema(field)
+        attribute = field.attribute or name
+
+        if nested is not None and attribute in relationships:
+            dumped[attribute] = nested
+        elif attribute in mapper.column_attrs:
+            columns.add(attribute)
+
+    options = []
+
+    if columns != set(mapper.column_attrs.keys()):
+        # keep the columns the dumped relationships are loaded by
+        for key in dumped:
+            columns.update(mapper.get_property_by_column(column).key
+                           for column in relationships[key].local_columns if column in mapper.columns.values())
+
+        attributes = [getattr(model, key) for key in sorted(columns)]
+        options.append(parent.load_only(*attributes) if parent is not None else load_only(*attributes))
+
+    for relationship in relationships:
+        attribute = getattr(model, relationship.key)
+
+        if relationship.key not in dumped:
+            # never touched by the schema, so don't let a model level
+            # lazy='subquery' or lazy='joined' load it for nothing
+            options.append(parent.lazyload(attribute) if parent is not None else lazyload(attribute))
+            continue
+
+        loader = parent.selectinload(attribute) if parent is not None else selectinload(attribute)
+        children = build_options(relationship.mapper.class_, dumped[relationship.key], loader)
+
+        options.extend(children or [loader])
+
+    return options
+
+
+def loading_profile(model, schema):
+    """ Loader options that eagerly load exactly the relationships ``schema`` dumps.
+
+    Every dumped relationship, however deeply nested, is fetched with one
+    ``selectin`` query, so dumping a list costs a fixed number of queries.
+    """
+    key = (model, schema)
+
+    if key not in _profiles:
+        _profiles[key] = build_options(model, schema)
+
+    return _profiles[key]
+
+
+def forget(schemas):
+    """ Drop the loading profiles built for ``schemas``. """
+    for key in [key for key in _profiles if key[1] in schemas]:
+        _profiles.pop(key, None)
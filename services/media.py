@@ -0,0 +1,134 @@
+import mimetypes
+import os
+from collections import namedtuple
+from flask import Response, redirect, request, send_file
+from sqlalchemy import and_, select
+from werkzeug.security import safe_join
+from library import app, db, storage
+from library.models import Blob, Review, ReviewImage
+from services.blobs import BLOB_DIRECTORY
+from services.uploads import IMAGE_COLUMNS, UPLOAD_DIRECTORIES
+
+MediaFile = namedtuple('MediaFile', 'path mimetype etag immutable')
+
+WEBP = 'image/webp'
+
+
+def variant_names():
+    return {f'.{name}.webp': name for name in app.config['IMAGE_VARIANTS']}
+
+
+def resolve_blob(path):
+    """ The blob, or one of its variants, at ``path``, looked up by its sha256. """
+    name = os.path.basename(path)
+    sha256, suffix = name[:64], name[64:]
+    blob = Blob.query.get(sha256)
+
+    if blob is None:
+        return None
+
+    if path == blob.path:
+        return MediaFile(path, blob.content_type, sha256, True)
+
+    # variants are rendered from the blob, so its hash names them too
+    variant = variant_names().get(suffix)
+
+    if variant is not None and os.path.dirname(path) == os.path.dirname(blob.path):
+        return MediaFile(path, WEBP, f'{sha256}.{variant}', True)
+
+    return None
+
+
+def resolve_legacy(path):
+    """ An upload from before blobs, looked up through the row its folder names.
+
+    Pictures were kept in ``<folder>/<id>/<file>``, review images in
+    ``review_images/<review id>/<id>/<file>``.
+    """
+    parts = path.split('/')
+    models = {directory: model for model, directory in UPLOAD_DIRECTORIES.items()}
+    model = models.get(parts[0])
+    ids = parts[1:-1]
+
+    if model is None or len(ids) != (2 if model is Review else 1) or not all(id.isdigit() for id in ids):
+        return None
+
+    if model is Review:
+        model = ReviewImage
+        where = and_(ReviewImage.review_id == int(ids[0]), ReviewImage.id == int(ids[1]))
+    else:
+        where = model.id == int(ids[0])
+
+    column, variants_column = IMAGE_COLUMNS[model]
+    rows = db.session.execute(select(getattr(model, column), getattr(model, variants_column)).where(where))
+
+    for upload, variants in rows:
+        if path == upload:
+            return MediaFile(path, mimetypes.guess_type(path)[0], None, False)
+
+        if path in (variants or {}).values():
+            return MediaFile(path, WEBP, None, False)
+
+    return None
+
+
+def resolve(path):
+    """ The ``MediaFile`` an image column refers to at ``path`` (an upload or one of its variants), else ``None``. """
+    if path.startswith(BLOB_DIRECTORY + '/'):
+        return resolve_blob(path)
+
+    return resolve_legacy(path)
+
+
+def send_media(media):
+    """ Respond with the ``MediaFile`` ``media`` without reading it into memory.
+
+    Object storage gets a redirect to a presigned url. Behind nginx
+    (``MEDIA_ACCEL_REDIRECT``) only the headers are sent and nginx serves the
+    file itself. Otherwise ``send_file`` streams it through the server's file
+    wrapper (sendfile under gunicorn), answering ``Range`` and
+    ``If-None-Match`` requests.
+    """
+    if safe_join('/', media.path) is None:
+        return None
+
+    url = storage.url(media.path)
+
+    if url is not None:
+        response = redirect(url)
+        response.cache_control.private = True
+        # cached no longer than the url is valid
+        response.cache_control.max_age = app.config['S3_URL_EXPIRES'] // 2
+
+        return response
+
+    filename = storage.local_path(media.path)
+
+    if not os.path.isfile(filename):
+        return None
+
+    if app.config['MEDIA_ACCEL_REDIRECT']:
+        response = Response(mimetype=media.mimetype or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = app.config['MEDIA_ACCEL_REDIRECT'].rstrip('/') + '/' + media.path
+
+        if media.etag:
+            response.set_etag(media.etag)
+            # nginx answers Range itself, but only we know the content hash
+            response.make_conditional(request)
+
+            if response.status_code == 304:
+                del response.headers['X-Accel-Redirect']
+    else:
+        # legacy uploads get werkzeug's etag, from the file's modification time and size
+        response = send_file(filename, mimetype=media.mimetype, etag=media.etag or True, conditional=True)
+
+    response.cache_control.private = True
+
+    if media.immutable:
+        # the path names the content, a new upload gets a new path
+        response.cache_control.max_age = app.config['MEDIA_MAX_AGE']
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+
+    return response
@@ -0,0 +1,36 @@
+import asyncio
+from concurrent.futures import TimeoutError
+from functools import partial
+from sqlalchemy.util import await_only
+
+
+def running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def offload(fn, *args):
+    """ Call ``fn`` in a thread when serving ASGI, so blocking file and storage I/O doesn't stall the event loop.
+
+    Views run in a greenlet of the event loop's thread there (see
+    ``services.asgi``); under WSGI ``fn`` is just called.
+    """
+    loop = running_loop()
+
+    if loop is None:
+        return fn(*args)
+
+    return await_only(loop.run_in_executor(None, partial(fn, *args)))
+
+
+def wait(future, timeout):
+    """ ``future.result(timeout)``, yielding to the event loop while waiting when serving ASGI. """
+    if running_loop() is None:
+        return future.result(timeout=timeout)
+
+    try:
+        return await_only(asyncio.wait_for(asyncio.wrap_future(future), timeout))
+    except asyncio.TimeoutError:
+        raise TimeoutError from None
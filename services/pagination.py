@@ -0,0 +1,124 @@
+import base64
+import binascii
+import json
+from collections import namedtuple
+from flask_restful import abort
+from sqlalchemy import tuple_
+from library import app
+
+PageWindow = namedtuple('PageWindow', 'query limit after backwards keys')
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size=1):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        abort(400, message='Invalid cursor.')
+
+    if not isinstance(values, list) or len(values) != size or not isinstance(values[-1], int) \
+            or not all(isinstance(value, (int, float, str)) for value in values):
+        abort(400, message='Invalid cursor.')
+
+    return values
+
+
+def get_limit(args):
+    limit = args.get('limit', app.config['PAGINATION_DEFAULT_LIMIT'])
+
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        abort(400, message='Limit must be an integer.')
+
+    if limit < 1:
+        abort(400, message='Limit must be a positive integer.')
+
+    return min(limit, app.config['PAGINATION_MAX_LIMIT'])
+
+
+def page_window(query, model, args, sort=None):
+    """ Restrict ``query`` to the rows of the requested page (plus one to detect more pages).
+
+    Pages are addressed by the keys of the last (``after``) or first (``before``)
+    row seen, ``(sort column, id)`` or just ``id``, so every page is an index
+    range scan no matter how deep it is.
+    """
+    limit = get_limit(args)
+    after = args.get('after')
+    before = args.get('before')
+
+    if after and before:
+        abort(400, message='Use either after or before, not both.')
+
+    keys, descending = sort_keys(model, sort)
+
+    if before:
+        values = decode_cursor_for(before, keys)
+        query = query.filter(seek(keys, values, not descending)).order_by(*order(keys, not descending))
+    else:
+        if after:
+            values = decode_cursor_for(after, keys)
+            query = query.filter(seek(keys, values, descending))
+
+        query = query.order_by(*order(keys, descending))
+
+    return PageWindow(query.limit(limit + 1), limit, bool(after), bool(before), keys)
+
+
+def sort_keys(model, sort=None):
+    """ The keys rows are ordered by, ``(sort column, id)`` or just ``id``, and whether descending. """
+    column, descending = sort or (model.id, False)
+
+    return ((model.id,) if column is model.id else (column, model.id)), descending
+
+
+def decode_cursor_for(cursor, keys):
+    values = decode_cursor(cursor, len(keys))
+
+    # a cursor from another sort order must not reach the database as a mistyped parameter
+    for key, value in zip(keys, values):
+        if isinstance(value, bool) or not isinstance(value, key.type.python_type):
+            abort(400, message='Invalid cursor.')
+
+    return values
+
+
+def seek(keys, values, descending):
+    if len(keys) == 1:
+        return keys[0] < values[0] if descending else keys[0] > values[0]
+
+    return tuple_(*keys) < tuple_(*values) if descending else tuple_(*keys) > tuple_(*values)
+
+
+def order(keys, descending):
+    return [key.desc() for key in keys] if descending else list(keys)
+
+
+def cursor_for(window, instance):
+    return encode_cursor([getattr(instance, key.key) for key in window.keys])
+
+
+def paginate(window, options=()):
+    """ Load the rows of ``window`` and return them with opaque next/prev cursors. """
+    instances = window.query.options(*options).all()
+    has_more = len(instances) > window.limit
+
+    if window.backwards:
+        instances = instances[:window.limit][::-1]
+
+        next_cursor = cursor_for(window, instances[-1]) if instances else None
+        prev_cursor = cursor_for(window, instances[0]) if has_more else None
+    else:
+        instances = instances[:window.limit]
+
+        next_cursor = cursor_for(window, instances[-1]) if has_more else None
+        prev_cursor = cursor_for(window, instances[0]) if window.after and instances else None
+
+    return instances, {'next': next_cursor, 'prev': prev_cursor, 'limit': window.limit}
@@ -0,0 +1,114 @@
+import threading
+import time
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# upper bounds, in seconds, of the checkout wait histogram
+WAIT_BUCKETS = (0.001, 0.01, 0.1, 1)
+
+
+class CheckoutWaits:
+    """ Thread-safe counters of how long checkouts waited for a connection. """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(WAIT_BUCKETS) + 1)
+        self._lock = threading.Lock()
+
+    def record(self, wait, timed_out=False):
+        bucket = next((i for i, bound in enumerate(WAIT_BUCKETS) if wait < bound), len(WAIT_BUCKETS))
+
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.total += wait
+            self.max = max(self.max, wait)
+            self.histogram[bucket] += 1
+
+    def stats(self):
+        labels = [f'<{bound * 1000:g}ms' for bound in WAIT_BUCKETS] + [f'>={WAIT_BUCKETS[-1] * 1000:g}ms']
+
+        return {'checkouts': self.checkouts, 'timeouts': self.timeouts,
+                'wait_mean': self.total / self.checkouts if self.checkouts else 0.0, 'wait_max': self.max,
+                'wait_histogram': dict(zip(labels, self.histogram))}
+
+
+class CheckoutTiming:
+    """ Pool mixin recording how long each checkout took, connecting and pre-pinging included. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = CheckoutWaits()
+
+    def connect(self):
+        started = time.perf_counter()
+
+        try:
+            connection = super().connect()
+        except TimeoutError:
+            self.waits.record(time.perf_counter() - started, timed_out=True)
+            raise
+
+        self.waits.record(time.perf_counter() - started)
+
+        return connection
+
+    def recreate(self):
+        # engine.dispose() swaps the pool, the numbers carry on
+        pool = super().recreate()
+        pool.waits = self.waits
+
+        return pool
+
+    def stats(self):
+        return {'size': self.size(), 'checked_in': self.checkedin(), 'checked_out': self.checkedout(),
+                'overflow': self.overflow(), **self.waits.stats()}
+
+
+class InstrumentedQueuePool(CheckoutTiming, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(CheckoutTiming, AsyncAdaptedQueuePool):
+    pass
+
+
+def async_url(url):
+    """ ``url`` for asyncpg, the driver of the ASGI mode. """
+    return make_url(url).set(drivername='postgresql+asyncpg')
+
+
+def engine_options(config, asynchronous=False):
+    """ ``SQLALCHEMY_ENGINE_OPTIONS`` from the ``DATABASE_*`` settings, or the options of an asyncpg engine. """
+    options = {
+        'poolclass': InstrumentedAsyncQueuePool if asynchronous else InstrumentedQueuePool,
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+        'pool_pre_ping': config['DATABASE_POOL_PRE_PING'],
+    }
+
+    timeout = config['DATABASE_STATEMENT_TIMEOUT']
+
+    # SQLAlchemy's asyncpg dialect prepares every statement under a name on the server connection, which
+    # pgbouncer swaps between transactions; turning asyncpg's caches off doesn't change that
+    if asynchronous and config['DATABASE_TRANSACTION_POOLER']:
+        raise ValueError('The ASGI mode (asyncpg) does not work behind a transaction pooler, '
+                         'unset DATABASE_TRANSACTION_POOLER and connect to the database or a session pooler')
+
+    # a startup parameter, which transaction poolers reject; there it is set per transaction instead
+    if timeout and not config['DATABASE_TRANSACTION_POOLER']:
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(timeout)}} if asynchronous \
+            else {'options': f'-c statement_timeout={timeout}'}
+
+    return options
+
+
+def set_statement_timeout(connection, timeout):
+    """ Limit the statements of the transaction ``connection`` is in; nothing outlives it on a pooled server connection. """
+    connection.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout)}')
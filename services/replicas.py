@@ -0,0 +1,149 @@
+import hashlib
+import itertools
+import threading
+import time
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+from services.cache import TTLCache
+from services.pool import async_url
+
+# 0 when everything received is replayed, else how old the last replayed transaction is; 0 on a primary
+LAG = text("SELECT CASE WHEN NOT pg_is_in_recovery() "
+           "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+           "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END")
+
+READ_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+# clients that just wrote, remembered at once
+MAX_WRITERS = 10000
+# sent back by clients that wrote, so any process reads their writes from the primary
+COOKIE = 'read_primary'
+
+
+class Replica:
+    """ A replica's engine, and its asyncpg engine, created when the ASGI mode first reads from it. """
+
+    def __init__(self, url, options, async_options):
+        self.engine = create_engine(url, **options)
+        self.async_options = async_options
+        self.async_engine = None
+        self.name = self.engine.url.render_as_string(hide_password=True)
+        self.healthy = False
+        self.lag = None
+        self.checked_at = None
+        self.checking = False
+
+        event.listen(self.engine, 'handle_error', self.handle_error)
+
+    def handle_error(self, context):
+        # down until the next check says otherwise
+        if context.is_disconnect or context.connection is None:
+            self.healthy = False
+
+    def get_async_engine(self):
+        if self.async_engine is None:
+            self.async_engine = create_async_engine(async_url(self.engine.url), **self.async_options)
+            event.listen(self.async_engine.sync_engine, 'handle_error', self.handle_error)
+
+        return self.async_engine
+
+    def stats(self):
+        stats = {'url': self.name, 'healthy': self.healthy, 'lag': self.lag, 'pool': self.engine.pool.stats()}
+
+        if self.async_engine is not None:
+            stats['async_pool'] = self.async_engine.pool.stats()
+
+        return stats
+
+
+class ReplicaSet:
+    """ Read replicas handed out round-robin, skipping those that are down or lag more than ``max_lag`` seconds.
+
+    Replicas are checked in ``background`` every ``check_interval`` seconds,
+    when next chosen; one is only used after a check passed. Clients that
+    wrote in the last ``guard_ttl`` seconds read from the primary.
+    """
+
+    def __init__(self, urls, options, async_options, background, max_lag, check_interval, guard_ttl, logger):
+        self.replicas = [Replica(url, options, async_options) for url in urls]
+        self.background = background
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.guard_ttl = guard_ttl
+        self.logger = logger
+        self.writers = TTLCache(MAX_WRITERS, guard_ttl)
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+
+    def check(self, replica):
+        try:
+            with replica.engine.connect() as connection:
+                replica.lag = float(connection.execute(LAG).scalar())
+
+            replica.healthy = replica.lag <= self.max_lag
+
+            if not replica.healthy:
+                self.logger.warning('Replica %s lags %.1f s', replica.name, replica.lag)
+        except DBAPIError as e:
+            replica.healthy = False
+            self.logger.warning('Replica %s is down: %s', replica.name, e)
+        finally:
+            replica.checked_at = time.monotonic()
+            replica.checking = False
+
+    def schedule_checks(self):
+        now = time.monotonic()
+
+        with self._lock:
+            due = [replica for replica in self.replicas if not replica.checking
+                   and (replica.checked_at is None or now - replica.checked_at >= self.check_interval)]
+
+            for replica in due:
+                replica.checking = True
+
+        for replica in due:
+            self.background.submit(self.check, replica)
+
+    def choose(self, asynchronous=False):
+        """ The engine of the next healthy replica, ``None`` for the primary.
+
+        ``asynchronous`` gives the sync facade of its asyncpg engine, which
+        sessions of the ASGI mode use.
+        """
+        if not self.replicas:
+            return None
+
+        self.schedule_checks()
+        start = next(self._next)
+
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(start + i) % len(self.replicas)]
+
+            if replica.healthy:
+                return replica.get_async_engine().sync_engine if asynchronous else replica.engine
+
+        return None
+
+    def client(self, request):
+        authorization = request.headers.get('Authorization')
+
+        return hashlib.sha256(authorization.encode('utf-8')).hexdigest() if authorization else None
+
+    def reads_primary(self, request):
+        return not self.replicas or request.method not in READ_METHODS or COOKIE in request.cookies \
+               or self.client(request) in self.writers
+
+    def remember_write(self, request, response):
+        """ Read ``request``'s client from the primary until the replicas caught up with its write. """
+        if not self.replicas or request.method in READ_METHODS or response.status_code >= 400:
+            return
+
+        client = self.client(request)
+
+        if client is not None:
+            self.writers.set(client, True)
+
+        response.set_cookie(COOKIE, '1', max_age=self.guard_ttl, httponly=True)
+
+    def stats(self):
+        return [replica.stats() for replica in self.replicas]
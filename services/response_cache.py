@@ -0,0 +1,125 @@
+import threading
+from flask import request
+from flask_jwt import current_identity
+from sqlalchemy import event, inspect
+from library import db
+from services.cache import TTLCache
+from services.conditional import related_paths
+
+_dependencies = {}
+
+
+def dependencies(model, schema):
+    """ The models whose rows end up in a ``schema`` dump of ``model``. """
+    key = (model, schema)
+
+    if key not in _dependencies:
+        models = {model} | {path[-1].property.mapper.class_ for path in related_paths(model, schema)}
+        _dependencies[key] = tuple(sorted(models, key=lambda related: related.__name__))
+
+    return _dependencies[key]
+
+
+def forget(schemas):
+    for key in [key for key in _dependencies if key[1] in schemas]:
+        _dependencies.pop(key, None)
+
+
+def cascaded(model):
+    """ ``model`` plus every model whose rows are deleted with it, by ``ondelete='CASCADE'`` or an ORM cascade. """
+    models = {mapper.local_table: mapper.class_ for mapper in db.Model.registry.mappers}
+    found = {model}
+    pending = [model]
+
+    while pending:
+        current = pending.pop()
+        table = inspect(current).local_table
+        dependents = {relationship.mapper.class_ for relationship in inspect(current).relationships
+                      if relationship.cascade.delete}
+
+        for dependent_table, dependent in models.items():
+            if any(fk.column.table is table and fk.ondelete and fk.ondelete.upper() == 'CASCADE'
+                   for fk in dependent_table.foreign_keys):
+                dependents.add(dependent)
+
+        for dependent in dependents - found:
+            found.add(dependent)
+            pending.append(dependent)
+
+    return found
+
+
+def changed_models(session):
+    changed = set()
+
+    for instance in session.new:
+        changed.add(type(instance))
+
+    for instance in session.dirty:
+        changed.add(type(instance))
+        state = inspect(instance)
+
+        # linking rows through an association table changes both sides
+        for relationship in state.mapper.relationships:
+            if relationship.secondary is not None and state.attrs[relationship.key].history.has_changes():
+                changed.add(relationship.mapper.class_)
+
+    for instance in session.deleted:
+        changed.update(cascaded(type(instance)))
+
+    return changed
+
+
+class ResponseCache:
+    """ LRU/TTL cache of serialized GET responses.
+
+    Keys carry a generation number for each model the response embeds;
+    committing a change to a model bumps its generation, so every cached
+    response that includes it stops being reachable and ages out.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.entries = TTLCache(maxsize, ttl)
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def key(self, model, schema):
+        identity = getattr(current_identity, 'id', None)
+        generations = tuple(self._generations.get(related, 0) for related in dependencies(model, schema))
+
+        return request.path, tuple(sorted(request.args.items(multi=True))), identity, generations
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, data, validators):
+        self.entries.set(key, (data, validators))
+
+    def clear(self):
+        self.entries.clear()
+
+    def invalidate(self, *models):
+        with self._lock:
+            for model in models:
+                self._generations[model] = self._generations.get(model, 0) + 1
+
+    def invalidate_deleted(self, model):
+        self.invalidate(*cascaded(model))
+
+    def watch(self, session):
+        """ Invalidate the models every committed ORM flush of ``session`` touched. """
+
+        @event.listens_for(session, 'after_flush')
+        def collect_changed_models(session, flush_context):
+            session.info.setdefault('changed_models', set()).update(changed_models(session))
+
+        @event.listens_for(session, 'after_commit')
+        def invalidate_changed_models(session):
+            self.invalidate(*session.info.pop('changed_models', ()))
+
+        @event.listens_for(session, 'after_soft_rollback')
+        def forget_changed_models(session, previous_transaction):
+            session.info.pop('changed_models', None)
+
+    def stats(self):
+        return self.entries.stats()
@@ -0,0 +1,84 @@
+from flask_restful import abort
+from sqlalchemy import cast, func, literal, select, tuple_, union_all
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+from library import db
+from library.models import SEARCH_CONFIG
+from services.loading import loading_profile
+from services.pagination import decode_cursor, encode_cursor, get_limit
+from services.serializers import serialize
+
+
+def search_query(text):
+    # websearch syntax: "quoted phrases", or, -excluded
+    return func.websearch_to_tsquery(SEARCH_CONFIG, text)
+
+
+def ranked(resources, tsquery):
+    """ ``(type, id, rank)`` of every row matching ``tsquery``, over all ``resources``. """
+    parts = [select(literal(name).label('type'), model.id.label('id'),
+                    # float8 so the rank survives the cursor round trip exactly (real doesn't)
+                    cast(func.ts_rank(model.search_vector, tsquery), DOUBLE_PRECISION).label('rank'))
+             .where(model.search_vector.op('@@')(tsquery))
+             for name, (model, schema) in resources.items()]
+
+    return union_all(*parts).subquery('results')
+
+
+def load_matches(model, schema, ids, tsquery, links):
+    """ Dump the matched rows and highlight the query terms in their searchable columns. """
+    document = func.concat_ws(' ', *[getattr(model, column) for column in model.__searchable__])
+    headline = func.ts_headline(SEARCH_CONFIG, document, tsquery)
+    statement = select(model, headline).options(*loading_profile(model, schema)).where(model.id.in_(ids))
+    rows = db.session.execute(statement).all()
+
+    items = serialize(schema, [instance for instance, _ in rows], links)
+
+    return {instance.id: (item, highlighted) for (instance, highlighted), item in zip(rows, items)}
+
+
+def search(text, resources, args, links=True):
+    """ One page of matches for ``text``, best ranked first, as ``(items, cursors)``.
+
+    Matching and ranking use the GIN indexed ``search_vector`` columns; pages
+    continue after the ``(rank, type, id)`` of the last match, and headlines
+    are only computed for the rows on the page.
+    """
+    limit = get_limit(args)
+    after = args.get('after')
+    tsquery = search_query(text)
+    results = ranked(resources, tsquery)
+    keys = (results.c.rank, results.c.type, results.c.id)
+
+    statement = select(*keys).order_by(*[key.desc() for key in keys]).limit(limit + 1)
+
+    if after:
+        rank, type, id = decode_cursor(after, 3)
+
+        if type not in resources:
+            abort(400, message='Invalid cursor.')
+
+        statement = statement.where(tuple_(*keys) < tuple_(float(rank), type, id))
+
+    matches = db.session.execute(statement).all()
+    has_more = len(matches) > limit
+    matches = matches[:limit]
+
+    loaded = {}
+
+    for name, (model, schema) in resources.items():
+        ids = [id for rank, type, id in matches if type == name]
+
+        if ids:
+            loaded[name] = load_matches(model, schema, ids, tsquery, links)
+
+    items = []
+
+    for rank, type, id in matches:
+        # skip rows deleted since they were ranked
+        if id in loaded[type]:
+            item, headline = loaded[type][id]
+            items.append({'type': type, 'id': id, 'rank': rank, 'headline': headline, 'item': item})
+
+    next_cursor = encode_cursor(list(matches[-1])) if has_more else None
+
+    return items, {'next': next_cursor, 'limit': limit}
@@ -0,0 +1,164 @@
+from functools import partial
+from flask_marshmallow.fields import Hyperlinks, URLFor as BaseURLFor
+from marshmallow import fields, missing
+from marshmallow.utils import ensure_text_type
+from marshmallow_enum import EnumField, LoadDumpOptions
+from services.links import URLFor, compile_url
+
+_serializers = {}
+
+
+def has_dump_hooks(schema):
+    return any(hooks for key, hooks in schema._hooks.items()
+               if 'pre_dump' in key or 'post_dump' in key)
+
+
+def attribute_getter(attr, convert):
+    def getter(obj):
+        value = getattr(obj, attr)
+
+        return None if value is None else convert(value)
+
+    return getter
+
+
+def text(value):
+    return value if type(value) is str else ensure_text_type(value)
+
+
+def compile_links(links):
+    if isinstance(links, dict):
+        compiled = [(key, compile_links(value)) for key, value in links.items()]
+
+        if any(build is None for key, build in compiled):
+            return None
+
+        return lambda obj: {key: build(obj) for key, build in compiled}
+
+    if isinstance(links, BaseURLFor):
+        if type(links)._serialize not in (BaseURLFor._serialize, URLFor._serialize):
+            return None
+
+        return compile_url(links)
+
+    if isinstance(links, (list, tuple)):
+        return None
+
+    return lambda obj: links
+
+
+def compile_field(name, field, model, links):
+    attr = field.attribute or name
+    field_type = type(field)
+
+    if model is not None and hasattr(model, attr):
+        if field_type is fields.Integer and not field.as_string:
+            return attribute_getter(attr, int)
+
+        if field_type is fields.String:
+            return attribute_getter(attr, text)
+
+        if field_type is fields.DateTime and (field.format or field.DEFAULT_FORMAT) in ('iso', 'iso8601'):
+            return attribute_getter(attr, lambda value: value.isoformat())
+
+        if field_type is EnumField:
+            if field.dump_by == LoadDumpOptions.value:
+                return attribute_getter(attr, lambda value: value.value)
+
+            return attribute_getter(attr, lambda value: value.name)
+
+        if field_type is fields.List and type(field.inner) is fields.Nested and not field.inner.many:
+            nested = compile_schema(field.inner.schema, links)
+
+            if not field.inner.schema.many:
+                return attribute_getter(attr, lambda value: [nested(each) for each in value])
+
+        if field_type is fields.Nested and not field.many and not field.schema.many:
+            return attribute_getter(attr, compile_schema(field.schema, links))
+
+    if field_type is Hyperlinks:
+        return compile_links(field.schema)
+
+    return None
+
+
+def compile_schema(schema, links=True):
+    """ Build a dump function for one ``schema`` instance.
+
+    Fields whose marshmallow serialization is a plain attribute read plus a
+    conversion (integers, strings, iso datetimes, enums, nested schemas,
+    ``URLFor`` links) become direct getters; every other field falls back to
+    its own ``serialize``, so the output is the same as ``schema.dump``.
+    With ``links=False`` the ``Hyperlinks`` fields are left out.
+    """
+    key = (schema, links)
+
+    if key in _serializers:
+        return _serializers[key]
+
+    if has_dump_hooks(schema):
+        def dump(obj):
+            data = schema.dump(obj, many=False)
+
+            if not links:
+                for name, field in schema.dump_fields.items():
+                    if isinstance(field, Hyperlinks):
+                        data.pop(name if field.data_key is None else field.data_key, None)
+
+            return data
+
+        _serializers[key] = dump
+
+        return dump
+
+    model = getattr(schema.opts, 'model', None)
+    getters = []
+    exact = True
+
+    for name, field in schema.dump_fields.items():
+        if not links and isinstance(field, Hyperlinks):
+            continue
+
+        getter = compile_field(name, field, model, links)
+
+        if getter is None:
+            # anything else goes through marshmallow itself, field by field
+            getter = partial(field.serialize, name, accessor=schema.get_attribute)
+            exact = False
+
+        getters.append((name if field.data_key is None else field.data_key, getter))
+
+    if exact:
+        def dump(obj):
+            return {key: getter(obj) for key, getter in getters}
+    else:
+        def dump(obj):
+            ret = {}
+
+            for key, getter in getters:
+                value = getter(obj)
+
+                if value is not missing:
+                    ret[key] = value
+
+            return ret
+
+    _serializers[key] = dump
+
+    return dump
+
+
+def forget(schemas):
+    """ Drop the dump functions compiled for ``schemas``. """
+    for key in [key for key in _serializers if key[0] in schemas]:
+        _serializers.pop(key, None)
+
+
+def serialize(schema, data, links=True):
+    """ Drop-in replacement for ``schema.dump(data)`` using the compiled dump function. """
+    dump = compile_schema(schema, links)
+
+    if schema.many:
+        return [dump(obj) for obj in data]
+
+    return dump(data)
@@ -0,0 +1,262 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    # only the s3 backend needs it
+    boto3 = None
+
+CHUNK_SIZE = 64 * 1024
+# the smallest part S3 accepts, but for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class LocalWriter:
+    """ Writes to a temporary file next to the target, renamed into place on ``close``. """
+
+    def __init__(self, filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        self.filename = filename
+        self.file = tempfile.NamedTemporaryFile(dir=os.path.dirname(filename), prefix='.', delete=False)
+
+    def write(self, data):
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+        # atomic, nobody ever sees half a file
+        os.replace(self.file.name, self.filename)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.file.name)
+
+
+class LocalStorage:
+    """ Keys are paths under ``root``. """
+
+    def __init__(self, root):
+        self.root = root
+
+    def filename(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def local_path(self, key):
+        return self.filename(key)
+
+    def writer(self, key, content_type=None):
+        return LocalWriter(self.filename(key))
+
+    def put_file(self, key, filename, content_type=None):
+        """ Move the local file ``filename`` to ``key``. """
+        os.makedirs(os.path.dirname(self.filename(key)), exist_ok=True)
+        shutil.move(filename, self.filename(key))
+
+    @contextmanager
+    def local_copy(self, key):
+        yield self.filename(key)
+
+    def exists(self, key):
+        return os.path.isfile(self.filename(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.filename(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_prefix(self, prefix):
+        """ Delete every key starting with ``prefix``; a prefix ending with ``/`` removes that folder. """
+        directory, start = os.path.split(self.filename(prefix))
+
+        if not start:
+            shutil.rmtree(directory, ignore_errors=True)
+            return
+
+        for name in os.listdir(directory) if os.path.isdir(directory) else ():
+            if name.startswith(start):
+                path = os.path.join(directory, name)
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+
+    def children(self, prefix):
+        """ The names right under the folder ``prefix``. """
+        directory = self.filename(prefix)
+
+        return os.listdir(directory) if os.path.isdir(directory) else []
+
+    def url(self, key):
+        return None
+
+
+class S3Writer:
+    """ A multipart upload fed in ``part_size`` parts, uploaded by ``executor`` while more data comes in.
+
+    Content that fits in one part is sent with a single ``PutObject``.
+    """
+
+    def __init__(self, storage, key, content_type):
+        self.storage = storage
+        self.key = key
+        self.content_type = content_type or 'application/octet-stream'
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    def write(self, data):
+        self.buffer += data
+
+        while len(self.buffer) >= self.storage.part_size:
+            self.submit(bytes(self.buffer[:self.storage.part_size]))
+            del self.buffer[:self.storage.part_size]
+
+    def submit(self, body):
+        client = self.storage.client
+
+        if self.upload_id is None:
+            self.upload_id = client.create_multipart_upload(Bucket=self.storage.bucket, Key=self.key,
+                                                            ContentType=self.content_type)['UploadId']
+
+        in_flight = [part for part in self.parts if not part.done()]
+
+        # bounds the parts held in memory when the upload is slower than the input
+        if len(in_flight) >= self.storage.workers:
+            in_flight[0].result()
+
+        number = len(self.parts) + 1
+        self.parts.append(self.storage.executor.submit(
+            client.upload_part, Bucket=self.storage.bucket, Key=self.key, UploadId=self.upload_id,
+            PartNumber=number, Body=body))
+
+    def close(self):
+        client = self.storage.client
+
+        if self.upload_id is None:
+            client.put_object(Bucket=self.storage.bucket, Key=self.key, Body=bytes(self.buffer),
+                              ContentType=self.content_type)
+            return
+
+        try:
+            if self.buffer:
+                self.submit(bytes(self.buffer))
+
+            parts = [{'PartNumber': number, 'ETag': part.result()['ETag']}
+                     for number, part in enumerate(self.parts, 1)]
+        except Exception:
+            self.abort()
+            raise
+
+        client.complete_multipart_upload(Bucket=self.storage.bucket, Key=self.key, UploadId=self.upload_id,
+                                         MultipartUpload={'Parts': parts})
+
+    def abort(self):
+        if self.upload_id is not None:
+            for part in self.parts:
+                part.cancel()
+
+            self.storage.client.abort_multipart_upload(Bucket=self.storage.bucket, Key=self.key,
+                                                       UploadId=self.upload_id)
+
+
+class S3Storage:
+    """ Keys are object keys in ``bucket`` of an S3-compatible server (AWS, MinIO, Ceph...). """
+
+    def __init__(self, bucket, endpoint_url=None, region=None, access_key_id=None, secret_access_key=None,
+                 part_size=8 * 1024 * 1024, workers=4, url_expires=3600):
+        if boto3 is None:
+            raise RuntimeError('STORAGE_BACKEND=s3 needs boto3, pip install boto3')
+
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region,
+                                   aws_access_key_id=access_key_id, aws_secret_access_key=secret_access_key)
+        self.bucket = bucket
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='s3-upload')
+        self.url_expires = url_expires
+
+    def local_path(self, key):
+        return None
+
+    def writer(self, key, content_type=None):
+        return S3Writer(self, key, content_type)
+
+    def put_file(self, key, filename, content_type=None):
+        """ Upload the local file ``filename`` to ``key``, in parallel parts when it is large, and remove it. """
+        write(self, key, open(filename, 'rb'), content_type)
+        os.remove(filename)
+
+    @contextmanager
+    def local_copy(self, key):
+        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(key)[1]) as file:
+            self.client.download_fileobj(self.bucket, key, file)
+            file.flush()
+
+            yield file.name
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return False
+
+            raise
+
+        return True
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def delete_prefix(self, prefix):
+        for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix):
+            keys = [{'Key': item['Key']} for item in page.get('Contents', ())]
+
+            # a page holds at most 1000 keys, as many as one DeleteObjects takes
+            if keys:
+                self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': keys, 'Quiet': True})
+
+    def children(self, prefix):
+        names = []
+        prefix = prefix.rstrip('/') + '/'
+
+        for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix,
+                                                                          Delimiter='/'):
+            names += [item['Prefix'][len(prefix):].rstrip('/') for item in page.get('CommonPrefixes', ())]
+            names += [item['Key'][len(prefix):] for item in page.get('Contents', ())]
+
+        return names
+
+    def url(self, key):
+        return self.client.generate_presigned_url('get_object', Params={'Bucket': self.bucket, 'Key': key},
+                                                  ExpiresIn=self.url_expires)
+
+
+def write(storage, key, file, content_type=None):
+    """ Stream the readable ``file`` to ``key`` and close it. """
+    writer = storage.writer(key, content_type)
+
+    try:
+        with file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                writer.write(chunk)
+    except Exception:
+        writer.abort()
+        raise
+
+    writer.close()
+
+
+def create_storage(config):
+    if config['STORAGE_BACKEND'] == 'local':
+        return LocalStorage(config['UPLOAD_FOLDER'])
+
+    if config['STORAGE_BACKEND'] == 's3':
+        return S3Storage(config['S3_BUCKET'], config['S3_ENDPOINT_URL'], config['S3_REGION'],
+                         config['S3_ACCESS_KEY_ID'], config['S3_SECRET_ACCESS_KEY'],
+                         config['S3_PART_SIZE'], config['S3_UPLOAD_WORKERS'], config['S3_URL_EXPIRES'])
+
+    raise ValueError(f"Unknown STORAGE_BACKEND {config['STORAGE_BACKEND']}")
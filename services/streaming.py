@@ -0,0 +1,48 @@
+import json
+from flask import Response, stream_with_context
+from library import app
+from services.serializers import serialize
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def wants_stream(request):
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def stream_query(query, model, scheme_many, links=True, order_by=None):
+    """ Stream every row of ``query`` as newline delimited JSON.
+
+    Rows are read through a server-side cursor ``STREAM_BATCH_SIZE`` at a time and
+    each batch is serialized and sent before the next one is fetched, so memory
+    stays flat no matter how big the table is. Rows come in ``order_by``
+    order, ``id`` by default. ``query`` must only eager load
+    with ``selectin`` loaders, the others can't be combined with ``yield_per``.
+    """
+    batch_size = app.config['STREAM_BATCH_SIZE']
+
+    query = query.order_by(*(order_by or [model.id])) \
+        .execution_options(stream_results=True, max_row_buffer=batch_size) \
+        .yield_per(batch_size)
+
+    def generate():
+        batch = []
+
+        for instance in query:
+            batch.append(instance)
+
+            if len(batch) == batch_size:
+                yield dump_batch(scheme_many, batch, links)
+                batch = []
+
+        if batch:
+            yield dump_batch(scheme_many, batch, links)
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
+def dump_batch(scheme_many, batch, links):
+    return ''.join(json.dumps(item) + '\n' for item in serialize(scheme_many, batch, links))
@@ -0,0 +1,33 @@
+from sqlalchemy import select
+from library import db, storage
+from library.models import Author, Book, Review, ReviewImage, User
+
+# model -> storage folder holding one sub-folder per row id, for uploads stored before blobs
+UPLOAD_DIRECTORIES = {
+    Book: 'books',
+    Author: 'authors',
+    User: 'users',
+    Review: 'review_images',
+}
+
+# model -> (column holding the upload, column recording its variants)
+IMAGE_COLUMNS = {
+    Book: ('picture', 'picture_variants'),
+    Author: ('picture', 'picture_variants'),
+    User: ('picture', 'picture_variants'),
+    ReviewImage: ('image', 'image_variants'),
+}
+
+
+def sweep(model):
+    """ Remove the upload folders of ``model`` rows that no longer exist. """
+    directory = UPLOAD_DIRECTORIES[model]
+    ids = {int(name) for name in storage.children(directory) if name.isdigit()}
+
+    if not ids:
+        return
+
+    existing = set(db.session.execute(select(model.id).where(model.id.in_(ids))).scalars())
+
+    for id in ids - existing:
+        storage.delete_prefix(f'{directory}/{id}/')
@@ -0,0 +1,100 @@
+import os
+import tempfile
+from sqlalchemy import update
+from library import app, db, background, storage
+from services.blobs import is_blob
+from services.bulk import forget_rows
+from services.offload import offload
+from services.uploads import IMAGE_COLUMNS
+
+try:
+    from wand.image import Image
+except ImportError:
+    # Wand is installed but ImageMagick isn't: uploads are kept, just without variants
+    Image = None
+
+
+def variant_path(path, name):
+    return f'{os.path.splitext(path)[0]}.{name}.webp'
+
+
+def render(source, target, size):
+    """ Save ``source`` to ``target`` as WebP, shrunk to fit in ``size`` x ``size``. """
+    with Image(filename=source) as image:
+        image.transform(resize=f'{size}x{size}>')
+        image.strip()
+        image.format = 'webp'
+        image.save(filename=target)
+
+
+def remove_variants(variants):
+    for path in (variants or {}).values():
+        offload(storage.delete, path)
+
+
+def generate_variants(model, id, source):
+    """ Render the ``IMAGE_VARIANTS`` of upload ``source`` and record them on row ``id``.
+
+    Variants of a blob are shared, so they are only rendered once. Nothing is
+    recorded when the row has been given another upload (or deleted) in the
+    meantime.
+    """
+    if Image is None:
+        app.logger.warning('ImageMagick is not available, no variants for %s', source)
+        return
+
+    column, variants_column = IMAGE_COLUMNS[model]
+    variants = {}
+
+    directory = os.path.join(app.config['UPLOAD_FOLDER'], 'tmp')
+    os.makedirs(directory, exist_ok=True)
+
+    with storage.local_copy(source) as filename:
+        for name, size in app.config['IMAGE_VARIANTS'].items():
+            variants[name] = variant_path(source, name)
+
+            if is_blob(source) and storage.exists(variants[name]):
+                continue
+
+            descriptor, target = tempfile.mkstemp(dir=directory, suffix='.webp')
+            os.close(descriptor)
+
+            try:
+                render(filename, target, size)
+                storage.put_file(variants[name], target, 'image/webp')
+            finally:
+                if os.path.exists(target):
+                    os.remove(target)
+
+    statement = update(model).where(model.id == id, getattr(model, column) == source) \
+        .values({variants_column: variants}).execution_options(synchronize_session=False)
+    recorded = db.session.execute(statement).rowcount
+    db.session.commit()
+
+    if recorded:
+        forget_rows(model, [id])
+    elif not is_blob(source):
+        # blob variants go with the blob, when nothing uses it any more
+        remove_variants(variants)
+
+
+def replace_upload(model, instance, path):
+    """ Point ``instance`` at its new upload ``path``.
+
+    A previous upload from before blobs is removed with its variants, a
+    previous blob is left to ``collect_garbage``.
+    """
+    column, variants_column = IMAGE_COLUMNS[model]
+    previous = getattr(instance, column)
+
+    if previous and previous != path and not is_blob(previous):
+        remove_variants(getattr(instance, variants_column))
+        offload(storage.delete, previous)
+
+    setattr(instance, column, path)
+    setattr(instance, variants_column, None)
+
+
+def schedule_variants(model, instance):
+    """ Generate the variants of ``instance``'s current upload off the request thread. """
+    background.submit(generate_variants, model, instance.id, getattr(instance, IMAGE_COLUMNS[model][0]))